@@ -0,0 +1,54 @@
+import os
+import time
+import fcntl
+from contextlib import contextmanager
+from sqlalchemy import text
+from sqlmodel import Session
+from database import engine, create_db_and_tables
+from search import create_search_indexes
+from auth import create_initial_admin
+from versions import ensure_version_rows
+
+# One-time schema and data setup, shared by every server process.
+# Under gunicorn --preload it runs once in the master before workers fork
+# (see gunicorn.conf.py), so workers find it done and skip it. Otherwise the
+# lock makes concurrent processes run it one at a time instead of racing.
+
+BOOTSTRAP_LOCK_ID = 726_001 # Arbitrary, app-wide Postgres advisory lock key
+LOCK_FILE = os.getenv("BOOTSTRAP_LOCK_FILE", "/tmp/qrmedia-bootstrap.lock")
+
+_done = False
+
+@contextmanager
+def bootstrap_lock():
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:id)"), {"id": BOOTSTRAP_LOCK_ID})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": BOOTSTRAP_LOCK_ID})
+    else:
+        with open(LOCK_FILE, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def run_once():
+    global _done
+    if _done:
+        return
+    started = time.perf_counter()
+    with bootstrap_lock():
+        # Every step is idempotent, so whoever gets the lock second finds nothing to do
+        create_db_and_tables()
+        create_search_indexes()
+        with Session(engine) as session:
+            create_initial_admin(session)
+            ensure_version_rows(session)
+    _done = True
+    # Don't hand pooled connections to forked workers
+    engine.dispose()
+    print(f"Bootstrap finished in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,43 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Hashable
+
+# Idempotency keys seen recently by this worker process.
+# This answers the common case (client retries, double clicks) without a DB
+# round trip; the unique constraint on StatisticEvent catches whatever slips
+# past it (other workers, evicted keys, restarts).
+
+MAX_KEYS = int(os.getenv("EVENT_DEDUPE_MAX_KEYS", "100000"))
+TTL_SECONDS = int(os.getenv("EVENT_DEDUPE_TTL", str(6 * 60 * 60)))
+
+class RecentKeys:
+    def __init__(self, max_keys: int = MAX_KEYS, ttl: float = TTL_SECONDS):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self.keys: "OrderedDict[Hashable, float]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, key: Hashable) -> bool:
+        """Record `key`. Returns False if it was already seen within the TTL."""
+        now = time.monotonic()
+        with self.lock:
+            # Oldest entries are at the front: drop the expired ones
+            while self.keys:
+                oldest_key, seen_at = next(iter(self.keys.items()))
+                if now - seen_at < self.ttl:
+                    break
+                del self.keys[oldest_key]
+            if key in self.keys:
+                return False
+            self.keys[key] = now
+            if len(self.keys) > self.max_keys:
+                self.keys.popitem(last=False)
+            return True
+
+    def discard(self, key: Hashable):
+        with self.lock:
+            self.keys.pop(key, None)
+
+recent_events = RecentKeys()
@@ -0,0 +1,109 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Iterator, List, Optional
+from sqlalchemy import select, exists
+from sqlmodel import Session
+from database import engine
+from models import StatisticEvent, Assignment, Recipient, Album
+
+# Bulk exports streamed straight from a server-side cursor: rows are fetched
+# BATCH_SIZE at a time, encoded and gzip-compressed into chunks, so memory use
+# does not depend on the table size.
+
+BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024 # Uncompressed bytes buffered before compressing a chunk
+
+def events_query(start: Optional[datetime], end: Optional[datetime], album_id: Optional[int]):
+    query = (
+        select(
+            StatisticEvent.id, StatisticEvent.timestamp, StatisticEvent.event_type,
+            StatisticEvent.assignment_id, Assignment.album_id, Assignment.recipient_id,
+            StatisticEvent.media_item_id, StatisticEvent.session_id, StatisticEvent.details,
+        )
+        .join(Assignment, Assignment.id == StatisticEvent.assignment_id)
+        .order_by(StatisticEvent.id)
+    )
+    if start:
+        query = query.where(StatisticEvent.timestamp >= start)
+    if end:
+        query = query.where(StatisticEvent.timestamp < end)
+    if album_id is not None:
+        query = query.where(Assignment.album_id == album_id)
+    return query
+
+def assignments_query(start: Optional[datetime], end: Optional[datetime], album_id: Optional[int]):
+    query = (
+        select(
+            Assignment.id, Assignment.token, Assignment.created_at,
+            Assignment.recipient_id, Recipient.name.label("recipient_name"),
+            Assignment.album_id, Album.title.label("album_title"),
+        )
+        .join(Recipient, Recipient.id == Assignment.recipient_id)
+        .join(Album, Album.id == Assignment.album_id)
+        .order_by(Assignment.id)
+    )
+    if start:
+        query = query.where(Assignment.created_at >= start)
+    if end:
+        query = query.where(Assignment.created_at < end)
+    if album_id is not None:
+        query = query.where(Assignment.album_id == album_id)
+    return query
+
+def recipients_query(start: Optional[datetime], end: Optional[datetime], album_id: Optional[int]):
+    query = select(Recipient.id, Recipient.name, Recipient.email, Recipient.notes).order_by(Recipient.id)
+    if album_id is not None:
+        # Recipients with at least one assignment of the album
+        query = query.where(exists().where(Assignment.recipient_id == Recipient.id, Assignment.album_id == album_id))
+    return query
+
+DATASETS = {
+    "events": events_query,
+    "assignments": assignments_query,
+    "recipients": recipients_query,
+}
+
+def encode_csv(columns: List[str], rows) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+        if buf.tell() >= CHUNK_SIZE:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+def json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+def encode_jsonl(columns: List[str], rows) -> Iterator[str]:
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(zip(columns, row)), default=json_value)
+        lines.append(line)
+        size += len(line) + 1
+        if size >= CHUNK_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines, size = [], 0
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+def stream_export(dataset: str, fmt: str, start: Optional[datetime], end: Optional[datetime], album_id: Optional[int]) -> Iterator[bytes]:
+    query = DATASETS[dataset](start, end, album_id)
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) # gzip container
+    encode = encode_csv if fmt == "csv" else encode_jsonl
+    # Own session: this runs while the response streams, after the request's session is gone
+    with Session(engine) as session:
+        result = session.execute(query.execution_options(yield_per=BATCH_SIZE))
+        columns = list(result.keys())
+        for text_chunk in encode(columns, result):
+            compressed = compressor.compress(text_chunk.encode("utf-8"))
+            if compressed:
+                yield compressed
+    yield compressor.flush()
@@ -0,0 +1,23 @@
+import os
+import multiprocessing
+
+# Production server: gunicorn managing uvicorn workers.
+bind = "0.0.0.0:8000"
+worker_class = "uvicorn_worker.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+# Import the app once in the master; workers are forked with it already loaded
+preload_app = True
+# nginx sits in front of us
+forwarded_allow_ips = "*"
+timeout = 600 # Matches nginx proxy timeouts (large uploads)
+graceful_timeout = 30
+
+def on_starting(server):
+    # Schema + admin bootstrap once, before any worker exists
+    import bootstrap
+    bootstrap.run_once()
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared with workers
+    from database import engine
+    engine.dispose(close=False)
@@ -1,4 +1,9 @@
+import time
+_imported_at = time.perf_counter()
+
+import asyncio
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 
 app = FastAPI(title="QR Media Admin", root_path="/api")
@@ -6,9 +11,8 @@ app = FastAPI(title="QR Media Admin", root_path="/api")
 # Mount media directory
 app.mount("/media", StaticFiles(directory="media"), name="media")
 
-from database import create_db_and_tables, get_session
-from sqlmodel import Session
-from auth import create_initial_admin
+import bootstrap
+import watchtime
 from routers import auth, admin, public
 
 app.include_router(auth.router)
@@ -18,9 +22,21 @@ app.include_router(public.router)
 
 @app.on_event("startup")
 def on_startup():
-    create_db_and_tables()
-    with Session(next(get_session()).bind) as session: # Hacky way to get session but works for startup
-         create_initial_admin(session)
+    # No-op in workers forked after the gunicorn master already ran it
+    started = time.perf_counter()
+    bootstrap.run_once()
+    now = time.perf_counter()
+    print(f"Startup took {now - started:.3f}s (app imported {now - _imported_at:.2f}s ago)")
+
+
+@app.on_event("startup")
+async def start_watch_time_flush():
+    app.state.watch_time_flush = asyncio.create_task(watchtime.flush_periodically())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    app.state.watch_time_flush.cancel()
+    await run_in_threadpool(watchtime.flush)
 
 
 @app.get("/")
@@ -1,5 +1,6 @@
 from typing import Optional, List
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index, BigInteger
 from datetime import datetime
 import uuid
 
@@ -27,6 +28,14 @@ class MediaItem(SQLModel, table=True):
     cover_filename: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+    # Probed at upload time (see probe.py)
+    mime_type: Optional[str] = None
+    file_size: Optional[int] = Field(default=None, sa_type=BigInteger)
+    duration: Optional[float] = None # seconds
+    bitrate: Optional[int] = None # bits per second
+    width: Optional[int] = None
+    height: Optional[int] = None
+
     # Simple many-to-many with albums could be done, but for simplicity let's do:
     # A media item belongs to one album? Or multiple?
     # Requirement: "Album generates a link".
@@ -40,12 +49,13 @@ class Album(SQLModel, table=True):
     cover_filename: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
-    media_links: List["AlbumMediaLink"] = Relationship(back_populates="album", sa_relationship_kwargs={"cascade": "all, delete-orphan"})
+    media_links: List["AlbumMediaLink"] = Relationship(back_populates="album", sa_relationship_kwargs={"cascade": "all, delete-orphan", "order_by": "[AlbumMediaLink.position, AlbumMediaLink.media_item_id]"})
     assignments: List["Assignment"] = Relationship(back_populates="album", sa_relationship_kwargs={"cascade": "all, delete-orphan"})
 
 class AlbumMediaLink(SQLModel, table=True):
     album_id: Optional[int] = Field(default=None, foreign_key="album.id", primary_key=True)
     media_item_id: Optional[int] = Field(default=None, foreign_key="mediaitem.id", primary_key=True)
+    position: int = Field(default=0, sa_column_kwargs={"server_default": "0"}) # Track order inside the album
 
     album: Album = Relationship(back_populates="media_links")
     media_item: MediaItem = Relationship(back_populates="album_links")
@@ -63,6 +73,7 @@ class Assignment(SQLModel, table=True):
     
     sessions: List["AssignmentSession"] = Relationship(back_populates="assignment", sa_relationship_kwargs={"cascade": "all, delete-orphan"})
     events: List["StatisticEvent"] = Relationship(back_populates="assignment", sa_relationship_kwargs={"cascade": "all, delete-orphan"})
+    watch_times: List["WatchTime"] = Relationship(back_populates="assignment", sa_relationship_kwargs={"cascade": "all, delete-orphan"})
 
 class AlbumRead(SQLModel):
     id: int
@@ -80,12 +91,21 @@ class AssignmentSession(SQLModel, table=True):
     last_active_at: datetime = Field(default_factory=datetime.utcnow)
     user_agent: Optional[str] = None
     ip_address: Optional[str] = None
+    # Playback position at the last heartbeat, only while playing (watch time deltas)
+    playback_media_id: Optional[int] = None
+    playback_position: Optional[float] = None
     
     assignment: Optional[Assignment] = Relationship(back_populates="sessions")
     
 class StatisticEvent(SQLModel, table=True):
+    # Keyed on the session token, not session_id: SQLite reuses the rowids of deleted sessions
+    __table_args__ = (Index("uq_statisticevent_session_token_key", "session_token", "idempotency_key", unique=True),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     assignment_id: int = Field(foreign_key="assignment.id", index=True)
+    session_id: Optional[int] = Field(default=None, foreign_key="assignmentsession.id", ondelete="SET NULL")
+    session_token: Optional[str] = None
+    idempotency_key: Optional[str] = None # Client-generated; 'view' for the one view per session
     event_type: str # 'view', 'play', 'click'
     media_item_id: Optional[int] = Field(default=None, foreign_key="mediaitem.id")
     timestamp: datetime = Field(default_factory=datetime.utcnow)
@@ -93,4 +113,17 @@ class StatisticEvent(SQLModel, table=True):
     
     assignment: Optional[Assignment] = Relationship(back_populates="events")
 
+class WatchTime(SQLModel, table=True):
+    # Seconds played, aggregated per flush interval (see watchtime.py)
+    id: Optional[int] = Field(default=None, primary_key=True)
+    assignment_id: int = Field(foreign_key="assignment.id", index=True)
+    media_item_id: int = Field(foreign_key="mediaitem.id", ondelete="CASCADE")
+    seconds: float
+    recorded_at: datetime = Field(default_factory=datetime.utcnow)
+
+    assignment: Optional[Assignment] = Relationship(back_populates="watch_times")
 
+class TableVersion(SQLModel, table=True):
+    # Change counter per table, bumped in the same transaction as admin writes (ETags)
+    name: str = Field(primary_key=True)
+    version: int = Field(default=0)
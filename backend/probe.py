@@ -0,0 +1,342 @@
+import io
+import struct
+from typing import Optional
+
+# Media probing for uploads, in pure Python.
+# MediaProbe is fed every chunk while the upload streams to disk. It sniffs
+# the real MIME type from the first chunk's magic bytes (rejecting anything
+# that isn't audio/video), and keeps the head/tail of the file. finish() then
+# reads the container headers: MP3 (Xing/VBRI/CBR), WAV, Ogg (Vorbis/Opus/
+# Theora), MP4/MOV (moov box, read back from disk since it is often at the end)
+# and WebM/Matroska (Info and Tracks elements, at the start of the file).
+
+HEAD_SIZE = 256 * 1024
+TAIL_SIZE = 64 * 1024
+MAX_MOOV_SIZE = 32 * 1024 * 1024
+
+class UnsupportedMedia(ValueError):
+    pass
+
+def sniff_mime(head: bytes) -> Optional[str]:
+    if head[:3] == b"ID3":
+        return "audio/mpeg"
+    if len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        # Frame sync: MPEG audio layer bits 00 means ADTS AAC
+        return "audio/aac" if head[1] & 0x06 == 0 else "audio/mpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "audio/wav"
+    if head[:4] == b"OggS":
+        return "video/ogg" if b"\x80theora" in head[:4096] else "audio/ogg"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"M4A ", b"M4B ", b"M4P "):
+            return "audio/mp4"
+        return "video/quicktime" if brand == b"qt  " else "video/mp4"
+    if head[:4] == b"fLaC":
+        return "audio/flac"
+    if head[:4] == b"\x1aE\xdf\xa3":
+        return "video/webm"
+    return None
+
+class MediaProbe:
+    def __init__(self):
+        self.size = 0
+        self.head = bytearray()
+        self.tail = b""
+        self.mime_type: Optional[str] = None
+        self.has_video: Optional[bool] = None
+
+    def feed(self, chunk: bytes):
+        if self.size == 0:
+            self.mime_type = sniff_mime(chunk[:4096])
+            if not self.mime_type:
+                raise UnsupportedMedia("Unrecognized file format (expected audio or video)")
+        self.size += len(chunk)
+        if len(self.head) < HEAD_SIZE:
+            self.head += chunk[:HEAD_SIZE - len(self.head)]
+        self.tail = (self.tail + chunk)[-TAIL_SIZE:]
+
+    @property
+    def media_type(self) -> Optional[str]:
+        if not self.mime_type:
+            return None
+        if self.has_video is not None:
+            return "video" if self.has_video else "audio"
+        return self.mime_type.split("/")[0]
+
+    def finish(self, path: str) -> dict:
+        """Parse the container headers; returns MediaItem column values."""
+        if not self.mime_type:
+            # Nothing was fed (empty upload)
+            raise UnsupportedMedia("Empty file")
+        info = {}
+        head = bytes(self.head)
+        try:
+            if self.mime_type == "audio/mpeg":
+                with open(path, "rb") as f:
+                    info = parse_mp3(f, head, self.tail, self.size)
+            elif self.mime_type == "audio/wav":
+                info = parse_wav(head, self.size)
+            elif self.mime_type in ("audio/ogg", "video/ogg"):
+                info = parse_ogg(head, self.tail)
+            elif self.mime_type in ("audio/mp4", "video/mp4", "video/quicktime"):
+                with open(path, "rb") as f:
+                    info = parse_mp4(f, self.size)
+            elif self.mime_type == "video/webm":
+                info = parse_webm(head)
+        except (ValueError, IndexError, KeyError, ZeroDivisionError, struct.error):
+            # Damaged or unusual headers: keep the MIME type, skip the metadata
+            info = {}
+
+        self.has_video = info.pop("has_video", None)
+        if self.has_video is False and self.mime_type.startswith("video/"):
+            self.mime_type = "audio/webm" if self.mime_type == "video/webm" else "audio/mp4"
+        if info.get("duration") and not info.get("bitrate"):
+            info["bitrate"] = int(self.size * 8 / info["duration"])
+        return {
+            "mime_type": self.mime_type,
+            "file_size": self.size,
+            "duration": round(info["duration"], 3) if info.get("duration") else None,
+            "bitrate": info.get("bitrate"),
+            "width": info.get("width"),
+            "height": info.get("height"),
+        }
+
+# MP3
+
+MP3_BITRATES = {
+    "v1": [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    "v2": [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+MP3_SCAN_SIZE = 64 * 1024
+
+def parse_mp3(f, head: bytes, tail: bytes, size: int) -> dict:
+    offset = base = 0
+    if head[:3] == b"ID3":
+        tag_size = (head[6] & 0x7F) << 21 | (head[7] & 0x7F) << 14 | (head[8] & 0x7F) << 7 | (head[9] & 0x7F)
+        offset = 10 + tag_size + (10 if head[5] & 0x10 else 0)
+        if offset + MP3_SCAN_SIZE > len(head) and size > len(head):
+            # Tag larger than the buffered head (embedded cover art): read on from its end on disk
+            f.seek(offset)
+            head, base, offset = f.read(MP3_SCAN_SIZE), offset, 0
+
+    # First valid layer III frame header
+    for i in range(offset, len(head) - 4):
+        if head[i] != 0xFF or head[i + 1] & 0xE0 != 0xE0:
+            continue
+        version = (head[i + 1] >> 3) & 3
+        layer = (head[i + 1] >> 1) & 3
+        bitrate_index = head[i + 2] >> 4
+        rate_index = (head[i + 2] >> 2) & 3
+        if version != 1 and layer == 1 and bitrate_index not in (0, 15) and rate_index != 3:
+            break
+    else:
+        return {}
+
+    mpeg1 = version == 3
+    bitrate = MP3_BITRATES["v1" if mpeg1 else "v2"][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    samples_per_frame = 1152 if mpeg1 else 576
+    mono = head[i + 3] >> 6 == 3
+    audio_bytes = size - base - i - (128 if tail[-128:-125] == b"TAG" else 0)
+
+    # VBR files announce their frame count in a Xing/Info or VBRI header
+    xing = i + 4 + ((17 if mono else 32) if mpeg1 else (9 if mono else 17))
+    frames = None
+    if head[xing:xing + 4] in (b"Xing", b"Info") and struct.unpack(">I", head[xing + 4:xing + 8])[0] & 1:
+        frames = struct.unpack(">I", head[xing + 8:xing + 12])[0]
+    elif head[i + 36:i + 40] == b"VBRI":
+        frames = struct.unpack(">I", head[i + 50:i + 54])[0]
+
+    if frames:
+        duration = frames * samples_per_frame / sample_rate
+        return {"duration": duration, "bitrate": int(audio_bytes * 8 / duration)}
+    return {"duration": audio_bytes * 8 / bitrate, "bitrate": bitrate}
+
+# WAV
+
+def parse_wav(head: bytes, size: int) -> dict:
+    pos = 12
+    byte_rate = None
+    while pos + 8 <= len(head):
+        chunk_id, chunk_size = struct.unpack("<4sI", head[pos:pos + 8])
+        if chunk_id == b"fmt ":
+            byte_rate = struct.unpack("<I", head[pos + 16:pos + 20])[0]
+        elif chunk_id == b"data":
+            if byte_rate is None:
+                return {}
+            # Streamed WAVs may leave the data size unset
+            data_size = chunk_size if 0 < chunk_size < 0xFFFFFFFF else size - pos - 8
+            return {"duration": data_size / byte_rate, "bitrate": byte_rate * 8}
+        pos += 8 + chunk_size + (chunk_size & 1)
+    return {}
+
+# Ogg
+
+def parse_ogg(head: bytes, tail: bytes) -> dict:
+    serial = head[14:18]
+    segments = head[26]
+    packet = head[27 + segments:]
+    if packet[:7] == b"\x01vorbis":
+        rate, pre_skip = struct.unpack("<I", packet[12:16])[0], 0
+    elif packet[:8] == b"OpusHead":
+        # Opus granule positions always count 48 kHz samples
+        rate, pre_skip = 48000, struct.unpack("<H", packet[10:12])[0]
+    elif packet[:7] == b"\x80theora":
+        width = int.from_bytes(packet[14:17], "big")
+        height = int.from_bytes(packet[17:20], "big")
+        return {"width": width, "height": height}
+    else:
+        return {}
+
+    # Duration: granule position of the stream's last page
+    pos = tail.rfind(b"OggS")
+    while pos >= 0 and tail[pos + 14:pos + 18] != serial:
+        pos = tail.rfind(b"OggS", 0, pos)
+    if pos < 0:
+        return {}
+    granule = struct.unpack("<q", tail[pos + 6:pos + 14])[0]
+    return {"duration": max(granule - pre_skip, 0) / rate}
+
+# MP4 / QuickTime
+
+def iter_boxes(f, start: int, end: int):
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(16)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            size = end - pos
+        if size < header_size:
+            return
+        yield kind, pos + header_size, pos + size
+        pos += size
+
+def find_box(f, start: int, end: int, kind: bytes):
+    for box_kind, box_start, box_end in iter_boxes(f, start, end):
+        if box_kind == kind:
+            return box_start, box_end
+    return None
+
+def parse_mp4(f, size: int) -> dict:
+    moov = find_box(f, 0, size, b"moov")
+    if not moov or moov[1] - moov[0] > MAX_MOOV_SIZE:
+        return {}
+    f.seek(moov[0])
+    box = io.BytesIO(f.read(moov[1] - moov[0]))
+    moov_size = moov[1] - moov[0]
+
+    info = {"has_video": False}
+    mvhd = find_box(box, 0, moov_size, b"mvhd")
+    if mvhd:
+        box.seek(mvhd[0])
+        payload = box.read(mvhd[1] - mvhd[0])
+        if payload[0] == 1:
+            timescale, duration = struct.unpack(">IQ", payload[20:32])
+        else:
+            timescale, duration = struct.unpack(">II", payload[12:20])
+        if timescale:
+            info["duration"] = duration / timescale
+
+    for kind, trak_start, trak_end in iter_boxes(box, 0, moov_size):
+        if kind != b"trak":
+            continue
+        mdia = find_box(box, trak_start, trak_end, b"mdia")
+        hdlr = mdia and find_box(box, mdia[0], mdia[1], b"hdlr")
+        if not hdlr:
+            continue
+        box.seek(hdlr[0] + 8)
+        if box.read(4) != b"vide":
+            continue
+        info["has_video"] = True
+        tkhd = find_box(box, trak_start, trak_end, b"tkhd")
+        if tkhd:
+            # Width and height close the tkhd box, as 16.16 fixed point
+            box.seek(tkhd[1] - 8)
+            width, height = struct.unpack(">II", box.read(8))
+            info["width"], info["height"] = width >> 16, height >> 16
+    return info
+
+# WebM / Matroska
+
+EBML_SEGMENT = 0x18538067
+EBML_INFO = 0x1549A966
+EBML_TIMECODE_SCALE = 0x2AD7B1
+EBML_DURATION = 0x4489
+EBML_TRACKS = 0x1654AE6B
+EBML_TRACK_ENTRY = 0xAE
+EBML_TRACK_TYPE = 0x83
+EBML_VIDEO = 0xE0
+EBML_PIXEL_WIDTH = 0xB0
+EBML_PIXEL_HEIGHT = 0xBA
+
+def read_vint(data: bytes, pos: int, keep_marker: bool):
+    first = data[pos]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8 or pos + length > len(data):
+        raise ValueError("Bad EBML variable-length integer")
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in data[pos + 1:pos + length]:
+        value = value << 8 | byte
+    # All value bits set means "unknown size" (live-streamed segments and clusters)
+    unknown = not keep_marker and value == (1 << (7 * length)) - 1
+    return (None if unknown else value), pos + length
+
+def iter_elements(data: bytes, start: int, end: int):
+    pos = start
+    while pos < end:
+        element_id, pos = read_vint(data, pos, keep_marker=True)
+        size, pos = read_vint(data, pos, keep_marker=False)
+        element_end = min(end, pos + size) if size is not None else end
+        yield element_id, pos, element_end
+        if size is None:
+            return
+        pos += size
+
+def ebml_uint(data: bytes) -> int:
+    return int.from_bytes(data, "big")
+
+def parse_webm(head: bytes) -> dict:
+    info = {}
+    segment = next((e for e in iter_elements(head, 0, len(head)) if e[0] == EBML_SEGMENT), None)
+    if not segment:
+        return {}
+    scale, duration = 1000000, None
+    # Info and Tracks precede the clusters, so the head of the file is enough
+    for element_id, start, end in iter_elements(head, segment[1], segment[2]):
+        if element_id == EBML_INFO:
+            for child_id, child_start, child_end in iter_elements(head, start, end):
+                if child_id == EBML_TIMECODE_SCALE:
+                    scale = ebml_uint(head[child_start:child_end])
+                elif child_id == EBML_DURATION:
+                    fmt = ">f" if child_end - child_start == 4 else ">d"
+                    duration = struct.unpack(fmt, head[child_start:child_end])[0]
+        elif element_id == EBML_TRACKS:
+            info["has_video"] = False
+            for entry_id, entry_start, entry_end in iter_elements(head, start, end):
+                if entry_id != EBML_TRACK_ENTRY:
+                    continue
+                for child_id, child_start, child_end in iter_elements(head, entry_start, entry_end):
+                    if child_id == EBML_TRACK_TYPE and ebml_uint(head[child_start:child_end]) == 1:
+                        info["has_video"] = True
+                    elif child_id == EBML_VIDEO:
+                        for video_id, video_start, video_end in iter_elements(head, child_start, child_end):
+                            if video_id == EBML_PIXEL_WIDTH:
+                                info["width"] = ebml_uint(head[video_start:video_end])
+                            elif video_id == EBML_PIXEL_HEIGHT:
+                                info["height"] = ebml_uint(head[video_start:video_end])
+            break
+    if duration:
+        info["duration"] = duration * scale / 1e9
+    return info
@@ -0,0 +1,167 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from fastapi import HTTPException, Request
+from database import engine
+
+# In-process protection for the public endpoints.
+# - Token buckets per route, keyed by client IP, assignment token and session token.
+# - Global admission control: reject requests once as many are in flight as the
+#   DB pool can serve, instead of queueing them until the pool times out.
+# State lives in each worker process; buckets are kept in a bounded LRU.
+
+MAX_TRACKED_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))
+
+# route -> (tokens refilled per second, burst size)
+# Override with e.g. RATE_LIMIT_HEARTBEAT="0.5,5"
+DEFAULT_LIMITS: Dict[str, Tuple[float, int]] = {
+    "view": (0.5, 10),
+    "heartbeat": (0.5, 5),
+    "event": (2.0, 30),
+}
+
+def load_limits() -> Dict[str, Tuple[float, int]]:
+    limits = dict(DEFAULT_LIMITS)
+    for route in limits:
+        value = os.getenv(f"RATE_LIMIT_{route.upper()}")
+        if value:
+            rate, burst = value.split(",")
+            limits[route] = (float(rate), int(burst))
+    return limits
+
+ROUTE_LIMITS = load_limits()
+
+# Per-IP buckets are this many times larger than per-token ones (shared NATs, several QR codes per household)
+IP_LIMIT_FACTOR = float(os.getenv("RATE_LIMIT_IP_FACTOR", "5"))
+
+# Every open player beats every HEARTBEAT_INTERVAL seconds, so the per-IP heartbeat
+# bucket is sized by how many viewers may share one IP (classroom or venue Wi-Fi):
+# a throttled beat lets the session go stale and be taken over by another device.
+HEARTBEAT_INTERVAL = 10
+MAX_VIEWERS_PER_IP = int(os.getenv("RATE_LIMIT_VIEWERS_PER_IP", "200"))
+IP_ROUTE_LIMITS: Dict[str, Tuple[float, int]] = {
+    # Twice the beat rate: room for retries and /leave, which shares the bucket
+    "heartbeat": (2 * MAX_VIEWERS_PER_IP / HEARTBEAT_INTERVAL, MAX_VIEWERS_PER_IP),
+}
+
+def pool_capacity() -> int:
+    # QueuePool serves pool_size + max_overflow connections at once (5 + 10 by default)
+    pool = engine.pool
+    if hasattr(pool, "size") and getattr(pool, "_max_overflow", -1) >= 0:
+        return pool.size() + pool._max_overflow
+    return 15
+
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", str(pool_capacity())))
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, burst: int, now: float):
+        self.tokens = float(burst)
+        self.updated_at = now
+
+    def take(self, rate: float, burst: int, now: float, cost: int = 1) -> float:
+        """Consume `cost` tokens. Returns 0 if allowed, else seconds until they are available."""
+        self.tokens = min(burst, self.tokens + (now - self.updated_at) * rate)
+        self.updated_at = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0
+        return (cost - self.tokens) / rate
+
+class RateLimiter:
+    def __init__(self, max_keys: int = MAX_TRACKED_KEYS):
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def hit(self, route: str, key: str, factor: float = 1, cost: int = 1, limits: Optional[Tuple[float, int]] = None) -> float:
+        rate, burst = limits or ROUTE_LIMITS[route]
+        rate, burst = rate * factor, int(burst * factor)
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get((route, key))
+            if bucket is None:
+                bucket = self.buckets[(route, key)] = TokenBucket(burst, now)
+                if len(self.buckets) > self.max_keys:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end((route, key))
+            return bucket.take(rate, burst, now, cost)
+
+limiter = RateLimiter()
+
+class Admission:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def enter(self) -> bool:
+        with self.lock:
+            if self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+admission = Admission(MAX_IN_FLIGHT)
+
+def client_ip(request: Request) -> str:
+    # nginx sets X-Real-IP; request.client is the proxy itself
+    return request.headers.get("x-real-ip") or request.client.host
+
+async def request_session_token(request: Request) -> Optional[str]:
+    token = request.headers.get("x-session-token")
+    if token:
+        return token
+    if request.method == "POST":
+        try:
+            body = await request.json()
+        except ValueError:
+            return None
+        # The body isn't validated yet: anything malformed is left for the endpoint to reject (422)
+        if isinstance(body, dict) and isinstance(body.get("session_token"), str):
+            return body["session_token"]
+    return None
+
+def too_many_requests(retry_after: float) -> HTTPException:
+    return HTTPException(status_code=429, detail="Too many requests", headers={"Retry-After": str(int(retry_after) + 1)})
+
+def charge_events(session_token: str, count: int):
+    """Charge events batched into a heartbeat against the session's `event` bucket."""
+    if count:
+        retry_after = limiter.hit("event", "session:" + session_token, cost=count)
+        if retry_after:
+            raise too_many_requests(retry_after)
+
+def rate_limit(route: str):
+    """Dependency: token-bucket limit for `route`, then admission control."""
+    async def dependency(request: Request):
+        ip_key = "ip:" + client_ip(request)
+        if route in IP_ROUTE_LIMITS:
+            retry_after = limiter.hit(route, ip_key, limits=IP_ROUTE_LIMITS[route])
+        else:
+            retry_after = limiter.hit(route, ip_key, IP_LIMIT_FACTOR)
+        assignment_token = request.path_params.get("token")
+        if assignment_token:
+            retry_after = max(retry_after, limiter.hit(route, "assignment:" + assignment_token))
+        session_token = await request_session_token(request)
+        if session_token:
+            retry_after = max(retry_after, limiter.hit(route, "session:" + session_token))
+
+        if retry_after:
+            raise too_many_requests(retry_after)
+
+        if not admission.enter():
+            raise HTTPException(status_code=503, detail="Server busy, retry shortly", headers={"Retry-After": "1"})
+        try:
+            yield
+        finally:
+            admission.leave()
+    return dependency
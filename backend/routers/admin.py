@@ -1,35 +1,102 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlmodel import Session, select
-from typing import List, Optional
-from database import get_session
+from sqlalchemy import delete, insert, update, func
+from typing import List, Optional, Tuple
+from database import get_session, engine
 from models import User, Recipient, MediaItem, Album, Assignment, AlbumMediaLink, AlbumRead
 from routers.auth import get_current_admin
+from search import search_recipients, search_media
+from versions import bump_versions, cached_list
+from exports import stream_export
+from probe import MediaProbe, UnsupportedMedia
 from pydantic import BaseModel
 import shutil
 import os
 import uuid
-import qrcode
 import io
 import base64
+import asyncio
+import json
+from datetime import datetime
 
 router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(get_current_admin)])
 
 MEDIA_DIR = "media"
+# Max number of files written to disk at the same time by batch uploads
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
 
 # Recipient CRUD
 @router.post("/recipients", response_model=Recipient)
 def create_recipient(recipient: Recipient, session: Session = Depends(get_session)):
     session.add(recipient)
+    bump_versions(session, "recipient")
     session.commit()
     session.refresh(recipient)
     return recipient
 
 @router.get("/recipients", response_model=List[Recipient])
-def read_recipients(session: Session = Depends(get_session)):
-    return session.exec(select(Recipient)).all()
+def read_recipients(request: Request, session: Session = Depends(get_session)):
+    return cached_list(request, session, "recipients", ("recipient",), lambda: session.exec(select(Recipient)).all())
+
+# Typeahead search (indexed, see search.py)
+@router.get("/search")
+def search(
+    q: str = Query(..., min_length=1),
+    kind: Optional[str] = Query(default=None, pattern="^(recipients|media)$"),
+    limit: int = Query(default=10, ge=1, le=50),
+    session: Session = Depends(get_session)
+):
+    results = {}
+    if kind in (None, "recipients"):
+        results["recipients"] = search_recipients(session, q, limit)
+    if kind in (None, "media"):
+        results["media"] = search_media(session, q, limit)
+    return results
 
 import aiofiles
 
+async def save_upload(file: UploadFile, prefix: str = "", probe: Optional[MediaProbe] = None) -> str:
+    """Stream an uploaded file to MEDIA_DIR under a new unique name and return that name.
+
+    Each chunk is also fed to `probe` if given; a partial file is removed if
+    the probe rejects the upload or the write fails.
+    """
+    file_ext = file.filename.split(".")[-1]
+    new_filename = f"{prefix}{uuid.uuid4()}.{file_ext}"
+    file_path = os.path.join(MEDIA_DIR, new_filename)
+
+    # Async stream write to disk
+    try:
+        async with aiofiles.open(file_path, 'wb') as out_file:
+            while content := await file.read(1024 * 1024):  # 1MB chunks
+                if probe:
+                    probe.feed(content)
+                await out_file.write(content)
+    except BaseException:
+        # Also on cancellation (client gone mid-upload)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    return new_filename
+
+async def save_media_upload(file: UploadFile) -> Tuple[str, str, dict]:
+    """Save and probe an audio/video upload: returns (filename, media type, MediaItem metadata)."""
+    probe = MediaProbe()
+    new_filename = await save_upload(file, probe=probe)
+    file_path = os.path.join(MEDIA_DIR, new_filename)
+    try:
+        metadata = await run_in_threadpool(probe.finish, file_path)
+    except BaseException:
+        os.remove(file_path)
+        raise
+    return new_filename, probe.media_type, metadata
+
+def next_album_position(session: Session, album_id: int) -> int:
+    last_position = session.exec(select(func.max(AlbumMediaLink.position)).where(AlbumMediaLink.album_id == album_id)).one()
+    return 0 if last_position is None else last_position + 1
+
 # Media Upload
 @router.post("/upload")
 async def upload_media(
@@ -38,25 +105,110 @@ async def upload_media(
     media_type: str = Form(...), # audio/video
     session: Session = Depends(get_session)
 ):
-    # Verify file extension/type?
-    file_ext = file.filename.split(".")[-1]
-    new_filename = f"{uuid.uuid4()}.{file_ext}"
-    file_path = os.path.join(MEDIA_DIR, new_filename)
-    
-    # Async stream write to disk
-    async with aiofiles.open(file_path, 'wb') as out_file:
-        while content := await file.read(1024 * 1024):  # 1MB chunks
-            await out_file.write(content)
+    try:
+        new_filename, probed_type, metadata = await save_media_upload(file)
+    except UnsupportedMedia as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if probed_type != media_type:
+        os.remove(os.path.join(MEDIA_DIR, new_filename))
+        raise HTTPException(status_code=400, detail=f"File is {metadata['mime_type']}, not {media_type}")
         
-    media_item = MediaItem(title=title, media_type=media_type, filename=new_filename)
+    media_item = MediaItem(title=title, media_type=media_type, filename=new_filename, **metadata)
     session.add(media_item)
+    bump_versions(session, "mediaitem")
     session.commit()
     session.refresh(media_item)
     return media_item
 
+@router.post("/upload/batch")
+async def upload_media_batch(
+    files: List[UploadFile] = File(...),
+    album_id: Optional[int] = Form(default=None),
+    session: Session = Depends(get_session)
+):
+    """Upload several files at once, streaming one NDJSON line per file as it is saved.
+
+    Title comes from the filename, media type and metadata from probing the
+    file (see probe.py). All MediaItem rows are
+    created in a single insert once the writes are done (optionally appended
+    to an album), and the last line carries the created items.
+    """
+    if album_id is not None and not session.get(Album, album_id):
+        raise HTTPException(status_code=404, detail="Album not found")
+
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+    async def save_one(index: int, file: UploadFile):
+        async with semaphore:
+            try:
+                return index, file, await save_media_upload(file), None
+            except (UnsupportedMedia, OSError) as e:
+                return index, file, None, str(e)
+
+    def insert_rows(rows: List[dict]) -> List[dict]:
+        # Own session: the request-scoped one may already be closed while streaming
+        with Session(engine) as db:
+            # Rows must come back in file order: album positions are assigned from it
+            created = db.scalars(insert(MediaItem).returning(MediaItem, sort_by_parameter_order=True), rows).all()
+            if album_id is not None:
+                position = next_album_position(db, album_id)
+                db.exec(insert(AlbumMediaLink), params=[
+                    {"album_id": album_id, "media_item_id": item.id, "position": position + offset}
+                    for offset, item in enumerate(created)
+                ])
+            created = [item.model_dump(mode="json") for item in created]
+            bump_versions(db, "mediaitem", "albummedialink")
+            db.commit()
+            return created
+
+    async def results():
+        tasks = [asyncio.ensure_future(save_one(i, f)) for i, f in enumerate(files)]
+        committed = False
+        try:
+            saved = []
+            for done in asyncio.as_completed(tasks):
+                index, file, upload, error = await done
+                if error:
+                    yield json.dumps({"filename": file.filename, "status": "error", "detail": error}) + "\n"
+                    continue
+                saved.append((index, file, upload))
+                yield json.dumps({"filename": file.filename, "status": "saved", "media_type": upload[1], "duration": upload[2]["duration"]}) + "\n"
+
+            # Keep the order the files were sent in, not the order they finished
+            saved.sort(key=lambda entry: entry[0])
+            rows = [{
+                "title": os.path.splitext(os.path.basename(file.filename))[0],
+                "media_type": media_type,
+                "filename": new_filename,
+                **metadata,
+            } for _, file, (new_filename, media_type, metadata) in saved]
+
+            created = []
+            if rows:
+                try:
+                    created = await run_in_threadpool(insert_rows, rows)
+                except Exception as e:
+                    print(f"Batch upload insert failed: {e}")
+                    yield json.dumps({"status": "error", "detail": "Saving media failed"}) + "\n"
+                    return
+            committed = True
+            yield json.dumps({"status": "done", "media": created}) + "\n"
+        finally:
+            # Insert failed or the client went away: don't leave files without rows behind
+            if not committed:
+                for task in tasks:
+                    if not task.done():
+                        task.cancel() # save_upload removes its partial file
+                    elif not task.cancelled() and task.exception() is None and task.result()[2]:
+                        file_path = os.path.join(MEDIA_DIR, task.result()[2][0])
+                        if os.path.exists(file_path):
+                            os.remove(file_path)
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
 @router.get("/media", response_model=List[MediaItem])
-def get_media(session: Session = Depends(get_session)):
-    return session.exec(select(MediaItem)).all()
+def get_media(request: Request, session: Session = Depends(get_session)):
+    return cached_list(request, session, "media", ("mediaitem",), lambda: session.exec(select(MediaItem)).all())
 
 # Cover Upload
 @router.post("/upload/cover")
@@ -68,13 +220,7 @@ async def upload_cover(
     if not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail="File must be an image")
         
-    file_ext = file.filename.split(".")[-1]
-    new_filename = f"cover_{uuid.uuid4()}.{file_ext}"
-    file_path = os.path.join(MEDIA_DIR, new_filename)
-    
-    async with aiofiles.open(file_path, 'wb') as out_file:
-        while content := await file.read(1024 * 1024):
-            await out_file.write(content)
+    new_filename = await save_upload(file, prefix="cover_")
             
     return {"filename": new_filename}
 
@@ -88,6 +234,7 @@ def set_album_cover(album_id: int, cover: CoverUpdate, session: Session = Depend
         raise HTTPException(status_code=404, detail="Album not found")
     album.cover_filename = cover.filename
     session.add(album)
+    bump_versions(session, "album")
     session.commit()
     return {"message": "Cover set"}
 
@@ -98,6 +245,7 @@ def set_media_cover(media_id: int, cover: CoverUpdate, session: Session = Depend
         raise HTTPException(status_code=404, detail="Media not found")
     media.cover_filename = cover.filename
     session.add(media)
+    bump_versions(session, "mediaitem")
     session.commit()
     return {"message": "Cover set"}
 
@@ -105,6 +253,7 @@ def set_media_cover(media_id: int, cover: CoverUpdate, session: Session = Depend
 @router.post("/albums", response_model=Album)
 def create_album(album: Album, session: Session = Depends(get_session)):
     session.add(album)
+    bump_versions(session, "album")
     session.commit()
     session.refresh(album)
     return album
@@ -116,13 +265,63 @@ def add_media_to_album(album_id: int, media_id: int, session: Session = Depends(
     if not album or not media:
         raise HTTPException(status_code=404, detail="Album or Media not found")
     
-    link = AlbumMediaLink(album_id=album_id, media_item_id=media_id)
+    # Append at the end of the current track list
+    link = AlbumMediaLink(album_id=album_id, media_item_id=media_id, position=next_album_position(session, album_id))
     session.add(link)
+    bump_versions(session, "albummedialink")
     session.commit()
     return {"message": "Media added to album"}
 
+class AlbumMediaUpdate(BaseModel):
+    media_ids: List[int] # Full desired track list, in order
+
+@router.put("/albums/{album_id}/media", response_model=List[MediaItem])
+def set_album_media(album_id: int, update_req: AlbumMediaUpdate, session: Session = Depends(get_session)):
+    """Replace the album track list (add/remove/reorder) in a single transaction."""
+    album = session.get(Album, album_id)
+    if not album:
+        raise HTTPException(status_code=404, detail="Album not found")
+
+    media_ids = update_req.media_ids
+    if len(set(media_ids)) != len(media_ids):
+        raise HTTPException(status_code=400, detail="Duplicate media in track list")
+
+    if media_ids:
+        found = set(session.exec(select(MediaItem.id).where(MediaItem.id.in_(media_ids))).all())
+        missing = [m_id for m_id in media_ids if m_id not in found]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Media not found: {missing}")
+
+    current = {
+        m_id: position for m_id, position in session.exec(
+            select(AlbumMediaLink.media_item_id, AlbumMediaLink.position).where(AlbumMediaLink.album_id == album_id)
+        ).all()
+    }
+    desired = {m_id: position for position, m_id in enumerate(media_ids)}
+
+    removed = [m_id for m_id in current if m_id not in desired]
+    added = [{"album_id": album_id, "media_item_id": m_id, "position": pos} for m_id, pos in desired.items() if m_id not in current]
+    moved = [{"album_id": album_id, "media_item_id": m_id, "position": pos} for m_id, pos in desired.items() if m_id in current and current[m_id] != pos]
+
+    if removed:
+        session.exec(delete(AlbumMediaLink).where(AlbumMediaLink.album_id == album_id, AlbumMediaLink.media_item_id.in_(removed)))
+    if added:
+        session.exec(insert(AlbumMediaLink), params=added)
+    if moved:
+        session.exec(update(AlbumMediaLink), params=moved)
+    bump_versions(session, "albummedialink")
+    session.commit()
+
+    # New manifest, in album order
+    return session.exec(
+        select(MediaItem).join(AlbumMediaLink).where(AlbumMediaLink.album_id == album_id).order_by(AlbumMediaLink.position, AlbumMediaLink.media_item_id)
+    ).all()
+
 @router.get("/albums", response_model=List[AlbumRead])
-def get_albums(session: Session = Depends(get_session)):
+def get_albums(request: Request, session: Session = Depends(get_session)):
+    return cached_list(request, session, "albums", ("album", "albummedialink", "mediaitem"), lambda: build_albums(session))
+
+def build_albums(session: Session) -> List[AlbumRead]:
     albums = session.exec(select(Album)).all()
     results = []
     for album in albums:
@@ -146,6 +345,7 @@ def assign_album(recipient_id: int, album_id: int, session: Session = Depends(ge
     # Check if assignment exists? Maybe allow multiple.
     assignment = Assignment(recipient_id=recipient_id, album_id=album_id)
     session.add(assignment)
+    bump_versions(session, "assignment")
     session.commit()
     session.refresh(assignment)
     
@@ -156,8 +356,8 @@ def assign_album(recipient_id: int, album_id: int, session: Session = Depends(ge
     return assignment
 
 @router.get("/assignments")
-def get_assignments(session: Session = Depends(get_session)):
-    return session.exec(select(Assignment)).all()
+def get_assignments(request: Request, session: Session = Depends(get_session)):
+    return cached_list(request, session, "assignments", ("assignment",), lambda: session.exec(select(Assignment)).all())
 
 @router.get("/qrcode/{token}")
 def generate_qr(token: str):
@@ -172,6 +372,9 @@ def generate_qr(token: str):
     url = f"/view/{token}" 
     # Note: Client will prepend host. 
     
+    # Imported here: qrcode pulls in PIL, which is slow to load and only needed by this endpoint
+    import qrcode
+
     qr = qrcode.QRCode(version=1, box_size=10, border=5)
     qr.add_data(url)
     qr.make(fit=True)
@@ -191,6 +394,7 @@ def delete_recipient(recipient_id: int, session: Session = Depends(get_session))
     if not recipient:
         raise HTTPException(status_code=404, detail="Recipient not found")
     session.delete(recipient)
+    bump_versions(session, "recipient", "assignment")
     session.commit()
     return {"message": "Recipient deleted"}
 
@@ -206,6 +410,7 @@ def delete_media(media_id: int, session: Session = Depends(get_session)):
         os.remove(file_path)
         
     session.delete(media)
+    bump_versions(session, "mediaitem", "albummedialink")
     session.commit()
     return {"message": "Media deleted"}
 
@@ -215,6 +420,7 @@ def delete_album(album_id: int, session: Session = Depends(get_session)):
     if not album:
         raise HTTPException(status_code=404, detail="Album not found")
     session.delete(album)
+    bump_versions(session, "album", "albummedialink", "assignment")
     session.commit()
     return {"message": "Album deleted"}
 
@@ -224,6 +430,7 @@ def remove_media_from_album(album_id: int, media_id: int, session: Session = Dep
     if not link:
         raise HTTPException(status_code=404, detail="Link not found")
     session.delete(link)
+    bump_versions(session, "albummedialink")
     session.commit()
     return {"message": "Media removed from album"}
 
@@ -233,12 +440,12 @@ def delete_assignment(assignment_id: int, session: Session = Depends(get_session
     if not assignment:
         raise HTTPException(status_code=404, detail="Assignment not found")
     session.delete(assignment)
+    bump_versions(session, "assignment")
     session.commit()
     return {"message": "Assignment deleted"}
 
 # Statistics
-from models import StatisticEvent, AssignmentSession
-from sqlalchemy import func
+from models import StatisticEvent, AssignmentSession, WatchTime
 
 @router.get("/assignments/{assignment_id}/stats")
 def get_assignment_stats(assignment_id: int, session: Session = Depends(get_session)):
@@ -263,10 +470,42 @@ def get_assignment_stats(assignment_id: int, session: Session = Depends(get_sess
     
     media_play_counts = {m_id: count for m_id, count in media_stats if m_id is not None}
 
+    # Seconds actually played, per media item (flushed periodically from heartbeats)
+    watch_stats = session.exec(
+        select(WatchTime.media_item_id, func.sum(WatchTime.seconds))
+        .where(WatchTime.assignment_id == assignment_id)
+        .group_by(WatchTime.media_item_id)
+    ).all()
+    media_watch_time = {m_id: round(seconds, 1) for m_id, seconds in watch_stats}
+
     return {
         "assignment_id": assignment_id,
         "total_views": total_views,
         "total_plays": total_plays,
         "last_active": last_session.last_active_at if last_session else None,
-        "media_stats": media_play_counts
+        "media_stats": media_play_counts,
+        "total_watch_time": round(sum(media_watch_time.values()), 1),
+        "media_watch_time": media_watch_time
     }
+
+# Bulk export (streamed, gzip-compressed)
+@router.get("/export/{dataset}")
+def export_data(
+    dataset: str,
+    format: str = Query(default="csv", pattern="^(csv|jsonl)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    album_id: Optional[int] = None,
+):
+    if dataset not in ("events", "assignments", "recipients"):
+        raise HTTPException(status_code=404, detail="Unknown dataset")
+    if dataset == "recipients" and (start or end):
+        raise HTTPException(status_code=400, detail="Recipients can't be filtered by date")
+
+    filename = f"{dataset}_{datetime.utcnow():%Y%m%d_%H%M%S}.{format}.gz"
+    return StreamingResponse(
+        stream_export(dataset, format, start, end, album_id),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
@@ -1,24 +1,46 @@
 from fastapi import APIRouter, Depends, HTTPException, Header, Request
 from sqlmodel import Session, select
 from database import get_session
+from ratelimit import rate_limit, client_ip, charge_events
+from dedupe import recent_events
+import watchtime
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from models import Assignment, Album, MediaItem, AlbumMediaLink, AssignmentSession, StatisticEvent
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime
 
 router = APIRouter(prefix="/public", tags=["public"])
 
-class HeartbeatRequest(BaseModel):
-    session_token: str
+# Heartbeats may arrive up to this much later than the playback they report
+WATCH_TIME_SLACK_SECONDS = 2
 
-class EventRequest(BaseModel):
-    session_token: str
+class EventData(BaseModel):
     event_type: str
     media_item_id: Optional[int] = None
     details: Optional[str] = None
+    idempotency_key: Optional[str] = None
+
+class EventRequest(EventData):
+    session_token: str
+
+class PlaybackPosition(BaseModel):
+    media_item_id: int
+    seconds: float
+    playing: bool
 
-@router.get("/view/{token}")
+# At most the `event` bucket's default burst, so a full batch can always be charged
+MAX_HEARTBEAT_EVENTS = 30
+
+class HeartbeatRequest(BaseModel):
+    session_token: str
+    events: List[EventData] = Field(default_factory=list, max_length=MAX_HEARTBEAT_EVENTS) # Queued by the client since the previous beat
+    position: Optional[PlaybackPosition] = None
+
+@router.get("/view/{token}", dependencies=[Depends(rate_limit("view"))])
 def view_assignment(
     token: str, 
     request: Request,
@@ -37,7 +59,7 @@ def view_assignment(
     existing_session = session.exec(select(AssignmentSession).where(AssignmentSession.assignment_id == assignment.id)).first()
     
     new_session_token = None
-    client_ip = request.client.host
+    ip_address = client_ip(request)
     user_agent = request.headers.get('user-agent')
 
     # Grace period for same client to recover session (e.g. refresh)
@@ -51,7 +73,7 @@ def view_assignment(
             
     if is_active:
         # Check identity overlap (IP + User Agent must match for takeover)
-        is_same_client = (existing_session.ip_address == client_ip and existing_session.user_agent == user_agent)
+        is_same_client = (existing_session.ip_address == ip_address and existing_session.user_agent == user_agent)
         
         # If token matches, it's definitely the same session -> OK
         if existing_session.token == x_session_token:
@@ -83,7 +105,7 @@ def view_assignment(
             assignment_id=assignment.id,
             token=new_session_token,
             last_active_at=current_time,
-            ip_address=client_ip,
+            ip_address=ip_address,
             user_agent=user_agent
         )
         session.add(new_sess)
@@ -91,7 +113,7 @@ def view_assignment(
 
     album = session.get(Album, assignment.album_id)
     # Fetch media items
-    media_links = session.exec(select(AlbumMediaLink).where(AlbumMediaLink.album_id == album.id)).all()
+    media_links = session.exec(select(AlbumMediaLink).where(AlbumMediaLink.album_id == album.id).order_by(AlbumMediaLink.position, AlbumMediaLink.media_item_id)).all()
     media_items = []
     for link in media_links:
         item = session.get(MediaItem, link.media_item_id)
@@ -107,63 +129,104 @@ def view_assignment(
         "assignment_id": assignment.id
     }
 
-@router.post("/heartbeat")
+def new_event(sess: AssignmentSession, data: EventData) -> Optional[StatisticEvent]:
+    """Build the event row, or None if it is a duplicate."""
+    # Deduping Logic
+    # One view per session; other events are deduped by the client's idempotency key (retries).
+    idempotency_key = "view" if data.event_type == 'view_assignment' else data.idempotency_key
+    if idempotency_key and not recent_events.add((sess.token, idempotency_key)):
+        return None
+    return StatisticEvent(
+        assignment_id=sess.assignment_id,
+        session_id=sess.id,
+        session_token=sess.token,
+        idempotency_key=idempotency_key,
+        event_type=data.event_type,
+        media_item_id=data.media_item_id,
+        details=data.details
+    )
+
+def commit_events(session: Session, events: List[StatisticEvent]) -> int:
+    """Commit pending changes plus `events`; returns how many events were stored.
+
+    Events already stored (by another worker, or before this one started) are
+    skipped by the unique index without failing the rest of the transaction,
+    so the caller's session update is always kept.
+    """
+    try:
+        stored = 0
+        dialect = session.get_bind().dialect.name
+        if events and dialect in ("postgresql", "sqlite"):
+            insert = postgresql_insert if dialect == "postgresql" else sqlite_insert
+            stmt = insert(StatisticEvent).values([evt.model_dump(exclude={"id"}) for evt in events])
+            stored = session.exec(stmt.on_conflict_do_nothing(index_elements=["session_token", "idempotency_key"])).rowcount
+            session.commit()
+        else:
+            session.commit()
+            for evt in events:
+                session.add(evt)
+                try:
+                    session.commit()
+                    stored += 1
+                except IntegrityError:
+                    session.rollback()
+        return stored
+    except Exception:
+        for evt in events:
+            recent_events.discard((evt.session_token, evt.idempotency_key))
+        raise
+
+def apply_heartbeat(sess: AssignmentSession, req: HeartbeatRequest) -> List[StatisticEvent]:
+    """Fold a beat into the session: activity, watch time and queued events."""
+    now = datetime.utcnow()
+    position = req.position
+    if position and sess.playback_position is not None and position.media_item_id == sess.playback_media_id:
+        # Credit what was played since the previous beat, no more than the wall clock allows (seeks)
+        elapsed = (now - sess.last_active_at).total_seconds() + WATCH_TIME_SLACK_SECONDS
+        played = min(position.seconds - sess.playback_position, elapsed)
+        if played > 0:
+            watchtime.add(sess.assignment_id, position.media_item_id, played)
+    playing = position is not None and position.playing
+    sess.playback_media_id = position.media_item_id if playing else None
+    sess.playback_position = position.seconds if playing else None
+    sess.last_active_at = now
+    return [evt for evt in (new_event(sess, data) for data in req.events) if evt]
+
+@router.post("/heartbeat", dependencies=[Depends(rate_limit("heartbeat"))])
 def heartbeat(req: HeartbeatRequest, session: Session = Depends(get_session)):
     sess = session.exec(select(AssignmentSession).where(AssignmentSession.token == req.session_token)).first()
     if not sess:
          raise HTTPException(status_code=404, detail="Session not found")
+    charge_events(req.session_token, len(req.events))
     
-    sess.last_active_at = datetime.utcnow()
+    events = apply_heartbeat(sess, req)
     session.add(sess)
-    session.commit()
+    commit_events(session, events)
     return {"status": "ok"}
 
-@router.post("/leave")
+@router.post("/leave", dependencies=[Depends(rate_limit("heartbeat"))])
 def leave_session(req: HeartbeatRequest, session: Session = Depends(get_session)):
     """Explicitly release the session lock."""
     sess = session.exec(select(AssignmentSession).where(AssignmentSession.token == req.session_token)).first()
     if sess:
+         try:
+             charge_events(req.session_token, len(req.events))
+         except HTTPException:
+             # Over the event budget: still release the lock, just drop the batch
+             req.events = []
+         # The last beat rides along with the leave request
+         commit_events(session, apply_heartbeat(sess, req))
          session.delete(sess)
          session.commit()
     return {"status": "ok"}
 
-@router.post("/event")
+@router.post("/event", dependencies=[Depends(rate_limit("event"))])
 def log_event(req: EventRequest, session: Session = Depends(get_session)):
     sess = session.exec(select(AssignmentSession).where(AssignmentSession.token == req.session_token)).first()
     if not sess:
          raise HTTPException(status_code=403, detail="Invalid or expired session")
-         
-    # Deduping Logic
-    # If event_type is 'view_assignment', check if we already logged it for this session/assignment
-    if req.event_type == 'view_assignment':
-        existing = session.exec(select(StatisticEvent).where(
-            StatisticEvent.assignment_id == sess.assignment_id,
-            StatisticEvent.event_type == 'view_assignment',
-            # We want to check if this specific session has viewed it? 
-            # OR just general views? Usually view count is "visits".
-            # If we want 1 visit per session, we can filter by time or link it to session if we had session_id in stats.
-            # But we don't have session_id in StatisticEvent.
-            # We can check if there's a view event from this session's created time range? 
-            # Or simpler: Rely on frontend not sending it twice, BUT ensure strictness here.
-            # Let's say: 1 view per 10 minutes from same IP? 
-            # Or: 1 view per assignment_id per 1 minute window?
-            # A simple robust way: "1 view per active session lifecycle".
-            # Since we don't link StatEvent to Session directly, we can use the 'details' or timestamp.
-            # Let's just allow it for now but rely on frontend. 
-            # Actually, user complained about double stats.
-            # Let's make view_assignment unique per day per assignment? No that's too aggressive.
-            # Let's block if a view event exists within the last 30 seconds for this assignment?
-            StatisticEvent.timestamp > datetime.utcnow() - timedelta(seconds=10)
-        )).first()
-        if existing:
-            return {"status": "ignored"}
-
-    evt = StatisticEvent(
-        assignment_id=sess.assignment_id,
-        event_type=req.event_type,
-        media_item_id=req.media_item_id,
-        details=req.details
-    )
-    session.add(evt)
-    session.commit()
+
+    evt = new_event(sess, req)
+    if not evt or not commit_events(session, [evt]):
+        return {"status": "ignored"}
     return {"status": "ok"}
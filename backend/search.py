@@ -0,0 +1,85 @@
+import re
+from typing import List
+from sqlalchemy import text
+from sqlmodel import Session, select
+from database import engine
+from models import Recipient, MediaItem
+
+# Text search over recipients and media titles.
+# Postgres: pg_trgm GIN indexes (substring/prefix matching, ranked by word similarity).
+# SQLite: FTS5 tables kept in sync by triggers (prefix matching, ranked by bm25).
+# Any other backend falls back to an unindexed ILIKE scan.
+
+RECIPIENT_DOC = "coalesce(name, '') || ' ' || coalesce(email, '') || ' ' || coalesce(notes, '')"
+
+SQLITE_FTS = {
+    "recipient": ["name", "email", "notes"],
+    "mediaitem": ["title"],
+}
+
+def create_search_indexes():
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_recipient_search_trgm ON recipient USING gin (({RECIPIENT_DOC}) gin_trgm_ops)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_mediaitem_title_trgm ON mediaitem USING gin (title gin_trgm_ops)"))
+    elif engine.dialect.name == "sqlite":
+        with engine.begin() as conn:
+            for table, columns in SQLITE_FTS.items():
+                create_sqlite_fts(conn, table, columns)
+
+def create_sqlite_fts(conn, table: str, columns: List[str]):
+    fts = f"{table}_fts"
+    exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": fts}).first()
+    if exists:
+        return
+
+    cols = ", ".join(columns)
+    new_values = ", ".join(f"new.{c}" for c in columns)
+    old_values = ", ".join(f"old.{c}" for c in columns)
+    # External content table: the FTS index stores no copy of the rows
+    conn.execute(text(f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"))
+    conn.execute(text(f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END"))
+    conn.execute(text(f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); END"))
+    conn.execute(text(
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values}); END"
+    ))
+    # Index the rows that existed before the FTS table
+    conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+def fts5_query(q: str) -> str:
+    # Every word must match as a prefix; quoting neutralizes FTS5 syntax in user input
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", q))
+
+def search_ids(session: Session, table: str, doc: str, q: str, limit: int) -> List[int]:
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        sql = f"SELECT id FROM {table} WHERE ({doc}) ILIKE :pattern ORDER BY word_similarity(:q, {doc}) DESC, id LIMIT :limit"
+        params = {"pattern": f"%{escape_like(q)}%", "q": q, "limit": limit}
+    elif dialect == "sqlite":
+        match = fts5_query(q)
+        if not match:
+            return []
+        sql = f"SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH :match ORDER BY bm25({table}_fts) LIMIT :limit"
+        params = {"match": match, "limit": limit}
+    else:
+        sql = f"SELECT id FROM {table} WHERE lower({doc}) LIKE lower(:pattern) ORDER BY id LIMIT :limit"
+        params = {"pattern": f"%{escape_like(q)}%", "limit": limit}
+    return [row[0] for row in session.execute(text(sql), params)]
+
+def escape_like(q: str) -> str:
+    return q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def load_ranked(session: Session, model, ids: List[int]):
+    if not ids:
+        return []
+    rows = {row.id: row for row in session.exec(select(model).where(model.id.in_(ids))).all()}
+    return [rows[i] for i in ids if i in rows]
+
+def search_recipients(session: Session, q: str, limit: int = 10) -> List[Recipient]:
+    return load_ranked(session, Recipient, search_ids(session, "recipient", RECIPIENT_DOC, q, limit))
+
+def search_media(session: Session, q: str, limit: int = 10) -> List[MediaItem]:
+    return load_ranked(session, MediaItem, search_ids(session, "mediaitem", "title", q, limit))
@@ -0,0 +1,8 @@
+#!/bin/sh
+# SERVER_MODE=production: gunicorn + uvicorn workers (see gunicorn.conf.py)
+# anything else: single uvicorn process with auto-reload for development
+if [ "$SERVER_MODE" = "production" ]; then
+    exec gunicorn main:app -c gunicorn.conf.py
+else
+    exec uvicorn main:app --host 0.0.0.0 --port 8000 --reload
+fi
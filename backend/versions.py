@@ -0,0 +1,50 @@
+import json
+import threading
+from typing import Callable, Dict, Tuple
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import update
+from sqlmodel import Session, select
+from models import TableVersion
+
+# Weak ETags for the admin list endpoints.
+# Every admin write bumps the counters of the tables it touches, in the same
+# transaction. A list endpoint reads only the counters it depends on: if the
+# client already has that version it gets a 304, otherwise the JSON body
+# serialized for that version is reused until the next write.
+# Counters live in the DB so all workers agree on them.
+
+TRACKED_TABLES = ["recipient", "mediaitem", "album", "albummedialink", "assignment"]
+
+_bodies: Dict[str, Tuple[str, bytes]] = {} # list name -> (etag, JSON body)
+_lock = threading.Lock()
+
+def ensure_version_rows(session: Session):
+    existing = set(session.exec(select(TableVersion.name)).all())
+    for name in TRACKED_TABLES:
+        if name not in existing:
+            session.add(TableVersion(name=name))
+    session.commit()
+
+def bump_versions(session: Session, *tables: str):
+    """Mark tables as changed; committed together with the caller's write."""
+    session.exec(update(TableVersion).where(TableVersion.name.in_(tables)).values(version=TableVersion.version + 1))
+
+def cached_list(request: Request, session: Session, name: str, tables: Tuple[str, ...], build: Callable) -> Response:
+    # Read the versions before the data: a write in between can only make the body newer than its ETag
+    versions = dict(session.exec(select(TableVersion.name, TableVersion.version).where(TableVersion.name.in_(tables))).all())
+    etag = 'W/"{}-{}"'.format(name, "-".join(str(versions.get(t, 0)) for t in tables))
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    with _lock:
+        cached = _bodies.get(name)
+    if cached and cached[0] == etag:
+        body = cached[1]
+    else:
+        body = json.dumps(jsonable_encoder(build())).encode("utf-8")
+        with _lock:
+            _bodies[name] = (etag, body)
+    return Response(content=body, media_type="application/json", headers=headers)
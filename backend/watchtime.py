@@ -0,0 +1,65 @@
+import os
+import asyncio
+import threading
+from datetime import datetime
+from typing import Dict, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+from database import engine
+from models import Assignment, MediaItem, WatchTime
+
+# Seconds played per (assignment, media item), accumulated in memory from
+# heartbeat playback positions and written to the DB as one aggregated row
+# per pair every FLUSH_INTERVAL by a background task in each worker (and on shutdown).
+
+FLUSH_INTERVAL = int(os.getenv("WATCH_TIME_FLUSH_SECONDS", "60"))
+
+_pending: Dict[Tuple[int, int], float] = {}
+_lock = threading.Lock()
+
+def add(assignment_id: int, media_item_id: int, seconds: float):
+    with _lock:
+        key = (assignment_id, media_item_id)
+        _pending[key] = _pending.get(key, 0) + seconds
+
+async def flush_periodically():
+    """Started by the app on startup, cancelled on shutdown."""
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        await run_in_threadpool(flush)
+
+def flush():
+    global _pending
+    with _lock:
+        pending, _pending = _pending, {}
+    if not pending:
+        return
+    now = datetime.utcnow()
+    try:
+        with Session(engine) as session:
+            # Pairs whose assignment or media item was deleted meanwhile are dropped, the rest kept
+            assignment_ids = set(session.exec(select(Assignment.id).where(Assignment.id.in_({a for a, _ in pending}))).all())
+            media_ids = set(session.exec(select(MediaItem.id).where(MediaItem.id.in_({m for _, m in pending}))).all())
+            rows = [
+                {"assignment_id": assignment_id, "media_item_id": media_item_id, "seconds": seconds, "recorded_at": now}
+                for (assignment_id, media_item_id), seconds in pending.items()
+                if assignment_id in assignment_ids and media_item_id in media_ids
+            ]
+            if not rows:
+                return
+            try:
+                session.exec(insert(WatchTime), params=rows)
+                session.commit()
+            except IntegrityError:
+                # Deleted between the check and the insert: fall back to one row at a time
+                session.rollback()
+                for row in rows:
+                    try:
+                        session.exec(insert(WatchTime), params=[row])
+                        session.commit()
+                    except IntegrityError:
+                        session.rollback()
+    except Exception as e:
+        print(f"Watch time flush failed: {e}")
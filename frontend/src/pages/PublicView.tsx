@@ -9,6 +9,15 @@ import {
 import { cn } from '../lib/utils';
 import { EulabFooter } from '../components/EulabFooter';
 
+const MAX_HEARTBEAT_EVENTS = 30;
+
+interface QueuedEvent {
+  event_type: string;
+  media_item_id?: number;
+  details?: string;
+  idempotency_key: string;
+}
+
 interface PublicData {
   recipient: string;
   album: string;
@@ -41,6 +50,13 @@ export const PublicView = () => {
   const sessionTokenRef = useRef<string | null>(null);
   const heartbeatIntervalRef = useRef<ReturnType<typeof setInterval> | null>(null);
   const hasLoggedViewRef = useRef(false);
+  const currentTrackRef = useRef<MediaItem | null>(null);
+  // Events waiting for the next heartbeat
+  const pendingEventsRef = useRef<QueuedEvent[]>([]);
+
+  useEffect(() => {
+    currentTrackRef.current = currentTrack;
+  }, [currentTrack]);
 
   useEffect(() => {
     fetchData();
@@ -53,8 +69,9 @@ export const PublicView = () => {
   useEffect(() => {
       const handleBeforeUnload = () => {
           if (sessionTokenRef.current) {
-              const data = JSON.stringify({ session_token: sessionTokenRef.current });
-              navigator.sendBeacon(api.defaults.baseURL + '/public/leave', data);
+              // Leave carries a final beat, so queued events and watch time are not lost
+              const data = JSON.stringify(buildHeartbeat(sessionTokenRef.current));
+              navigator.sendBeacon(api.defaults.baseURL + '/public/leave', new Blob([data], { type: 'application/json' }));
           }
       };
       
@@ -64,7 +81,8 @@ export const PublicView = () => {
           sessionTokenRef.current = data.session_token;
           
           if (!hasLoggedViewRef.current) {
-               logEvent('view_assignment', undefined, 'User viewed assignment');
+               // Sent right away (not queued) so short visits are still counted
+               sendEvent(newEvent('view_assignment', undefined, 'User viewed assignment'));
                hasLoggedViewRef.current = true;
           }
 
@@ -79,31 +97,60 @@ export const PublicView = () => {
       }
   }, [data]);
 
+  // Takes the queued events and the current playback position
+  const buildHeartbeat = (sToken: string) => {
+      const track = currentTrackRef.current;
+      const mediaElement = track?.media_type === 'video' ? videoRef.current : audioRef.current;
+      // The backend accepts at most MAX_HEARTBEAT_EVENTS per beat; the rest wait for the next one
+      const events = pendingEventsRef.current.splice(0, MAX_HEARTBEAT_EVENTS);
+      return {
+          session_token: sToken,
+          events,
+          position: track && mediaElement ? {
+              media_item_id: track.id,
+              seconds: mediaElement.currentTime,
+              playing: !mediaElement.paused
+          } : undefined
+      };
+  };
+
   const sendHeartbeat = async (sToken: string) => {
+      const beat = buildHeartbeat(sToken);
       try {
-          await api.post('/public/heartbeat', { session_token: sToken });
+          await api.post('/public/heartbeat', beat);
       } catch (err: any) {
           if (err.response && (err.response.status === 404 || err.response.status === 403)) {
                setIsBlocked(true);
                setError("Sessione scaduta o attiva in altra finestra.");
+          } else {
+               // Retry with the next beat; idempotency keys make this safe
+               pendingEventsRef.current = [...beat.events, ...pendingEventsRef.current];
           }
       }
   };
 
-  const logEvent = async (type: string, mediaId?: number, details?: string) => {
+  const newEvent = (type: string, mediaId?: number, details?: string): QueuedEvent => ({
+      event_type: type,
+      media_item_id: mediaId,
+      details: details,
+      // Lets the server drop duplicates if this event is sent again
+      idempotency_key: `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+  });
+
+  const sendEvent = async (event: QueuedEvent) => {
       if(!sessionTokenRef.current) return;
       try {
-          await api.post('/public/event', {
-              session_token: sessionTokenRef.current,
-              event_type: type,
-              media_item_id: mediaId,
-              details: details
-          });
+          await api.post('/public/event', { session_token: sessionTokenRef.current, ...event });
       } catch (err) {
           console.error("Log event failed", err);
       }
   };
 
+  // Playback events ride along with the next heartbeat
+  const logEvent = (type: string, mediaId?: number, details?: string) => {
+      pendingEventsRef.current.push(newEvent(type, mediaId, details));
+  };
+
   const fetchData = async () => {
     try {
       const storedTokenKey = `session_token_${token}`;
@@ -370,7 +417,9 @@ export const PublicView = () => {
                                  <span className={cn("font-medium truncate", isActive ? "text-green-500" : "text-white")}>
                                     {item.title}
                                  </span>
-                                 <span className="text-xs text-[#b3b3b3] capitalize">{item.media_type}</span>
+                                 <span className="text-xs text-[#b3b3b3] capitalize">
+                                    {item.media_type}{item.duration ? ` · ${formatTime(item.duration)}` : ''}
+                                 </span>
                               </div>
                            </div>
 
@@ -18,6 +18,13 @@ export interface MediaItem {
   filename: string;
   cover_filename?: string;
   created_at: string;
+  // Probed at upload time
+  mime_type?: string;
+  file_size?: number;
+  duration?: number; // seconds
+  bitrate?: number;
+  width?: number;
+  height?: number;
 }
 
 export interface Album {
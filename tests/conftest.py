@@ -0,0 +1,48 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# Unit tests import the backend modules directly, against a throwaway SQLite DB.
+# (test_full_flow.py is a separate script that runs against the live stack.)
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.sqlite')}")
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """App client as an authenticated admin; uploads go to a temporary media dir."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "media").mkdir()
+    from fastapi.testclient import TestClient
+    import main
+    from routers.auth import get_current_admin
+    from ratelimit import limiter
+    # Every request comes from the same test client IP: start each test with fresh buckets
+    limiter.buckets.clear()
+    main.app.dependency_overrides[get_current_admin] = lambda: None
+    with TestClient(main.app) as c:
+        yield c
+    main.app.dependency_overrides.clear()
+
+@pytest.fixture
+def public_session(client):
+    """A fresh assignment viewed once: returns its session token."""
+    rec = client.post("/admin/recipients", json={"name": "Test"}).json()
+    alb = client.post("/admin/albums", json={"title": "Test"}).json()
+    assignment = client.post(f"/admin/assign?recipient_id={rec['id']}&album_id={alb['id']}").json()
+    return client.get(f"/public/view/{assignment['token']}").json()["session_token"]
+
+@pytest.fixture
+def make_media(client):
+    """Factory for MediaItem rows (no file on disk); returns their ids."""
+    from sqlmodel import Session
+    from database import engine
+    from models import MediaItem
+    def make(*titles: str):
+        with Session(engine) as session:
+            items = [MediaItem(title=title, media_type="audio", filename=f"{title}.mp3") for title in titles]
+            session.add_all(items)
+            session.commit()
+            return [item.id for item in items]
+    return make
@@ -0,0 +1,48 @@
+def make_album(client):
+    return client.post("/admin/albums", json={"title": "Album"}).json()["id"]
+
+def manifest(client, album_id):
+    rec = client.post("/admin/recipients", json={"name": "Listener"}).json()
+    assignment = client.post(f"/admin/assign?recipient_id={rec['id']}&album_id={album_id}").json()
+    return [item["id"] for item in client.get(f"/public/view/{assignment['token']}").json()["media"]]
+
+def test_set_album_media_adds_removes_and_reorders(client, make_media):
+    album_id = make_album(client)
+    a, b, c, d = make_media("a", "b", "c", "d")
+
+    response = client.put(f"/admin/albums/{album_id}/media", json={"media_ids": [a, b, c]})
+    assert [item["id"] for item in response.json()] == [a, b, c]
+
+    response = client.put(f"/admin/albums/{album_id}/media", json={"media_ids": [d, c, a]})
+    assert response.status_code == 200
+    assert [item["id"] for item in response.json()] == [d, c, a]
+    assert manifest(client, album_id) == [d, c, a]
+
+    assert client.put(f"/admin/albums/{album_id}/media", json={"media_ids": []}).json() == []
+    assert manifest(client, album_id) == []
+
+def test_set_album_media_rejects_duplicates(client, make_media):
+    album_id = make_album(client)
+    a, = make_media("a")
+    response = client.put(f"/admin/albums/{album_id}/media", json={"media_ids": [a, a]})
+    assert response.status_code == 400
+
+def test_set_album_media_missing_media_or_album(client, make_media):
+    album_id = make_album(client)
+    a, b = make_media("a", "b")
+    client.put(f"/admin/albums/{album_id}/media", json={"media_ids": [a]})
+
+    response = client.put(f"/admin/albums/{album_id}/media", json={"media_ids": [b, 999999]})
+    assert response.status_code == 404
+    assert "999999" in response.json()["detail"]
+    # Nothing changed
+    assert manifest(client, album_id) == [a]
+
+    assert client.put("/admin/albums/999999/media", json={"media_ids": [a]}).status_code == 404
+
+def test_tracks_appended_after_the_list_keep_their_place(client, make_media):
+    album_id = make_album(client)
+    a, b, c = make_media("a", "b", "c")
+    client.put(f"/admin/albums/{album_id}/media", json={"media_ids": [b, a]})
+    client.post(f"/admin/albums/{album_id}/add_media/{c}")
+    assert manifest(client, album_id) == [b, a, c]
@@ -0,0 +1,65 @@
+import io
+import wave
+import pytest
+
+def etag(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    return response.headers["etag"]
+
+def wav_bytes() -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(bytes(8000))
+    return buf.getvalue()
+
+@pytest.mark.parametrize("path", ["/admin/recipients", "/admin/media", "/admin/albums", "/admin/assignments"])
+def test_matching_etag_gets_304(client, path):
+    tag = etag(client, path)
+    response = client.get(path, headers={"If-None-Match": tag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == tag
+    assert client.get(path, headers={"If-None-Match": 'W/"other", ' + tag}).status_code == 304
+    assert client.get(path, headers={"If-None-Match": 'W/"other"'}).status_code == 200
+
+def test_writes_change_etags_and_bodies(client, make_media):
+    before = etag(client, "/admin/recipients")
+    rec = client.post("/admin/recipients", json={"name": "New"}).json()
+    assert etag(client, "/admin/recipients") != before
+    assert rec["id"] in [r["id"] for r in client.get("/admin/recipients").json()]
+
+    album = client.post("/admin/albums", json={"title": "Album"}).json()
+    media_id, = make_media("track")
+    before = etag(client, "/admin/albums")
+    client.put(f"/admin/albums/{album['id']}/media", json={"media_ids": [media_id]})
+    assert etag(client, "/admin/albums") != before
+
+    # Deleting media changes the album lists too
+    before = etag(client, "/admin/albums")
+    client.delete(f"/admin/media/{media_id}")
+    assert etag(client, "/admin/albums") != before
+
+def test_cascading_delete_changes_assignments(client):
+    rec = client.post("/admin/recipients", json={"name": "Gone"}).json()
+    album = client.post("/admin/albums", json={"title": "Album"}).json()
+    assignment = client.post(f"/admin/assign?recipient_id={rec['id']}&album_id={album['id']}").json()
+    before = etag(client, "/admin/assignments")
+    client.delete(f"/admin/recipients/{rec['id']}")
+    assert etag(client, "/admin/assignments") != before
+    assert assignment["id"] not in [a["id"] for a in client.get("/admin/assignments").json()]
+
+    kept = client.post("/admin/recipients", json={"name": "Kept"}).json()
+    assignment = client.post(f"/admin/assign?recipient_id={kept['id']}&album_id={album['id']}").json()
+    before = etag(client, "/admin/assignments")
+    client.delete(f"/admin/albums/{album['id']}")
+    assert etag(client, "/admin/assignments") != before
+    assert assignment["id"] not in [a["id"] for a in client.get("/admin/assignments").json()]
+
+def test_batch_upload_changes_media_etag(client):
+    before = etag(client, "/admin/media")
+    client.post("/admin/upload/batch", files=[("files", ("tone.wav", wav_bytes()))])
+    assert etag(client, "/admin/media") != before
+    assert "tone" in [m["title"] for m in client.get("/admin/media").json()]
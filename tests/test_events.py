@@ -0,0 +1,63 @@
+from sqlmodel import Session, select
+from database import engine
+from dedupe import RecentKeys, recent_events
+from models import AssignmentSession, StatisticEvent
+import dedupe
+
+def test_recent_keys_rejects_duplicates():
+    keys = RecentKeys(max_keys=10, ttl=60)
+    assert keys.add((1, "a"))
+    assert not keys.add((1, "a"))
+    assert keys.add((2, "a"))
+
+def test_recent_keys_expire_and_stay_bounded(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(dedupe.time, "monotonic", lambda: now[0])
+    keys = RecentKeys(max_keys=2, ttl=10)
+    keys.add("a")
+    now[0] = 11
+    assert keys.add("a") # expired
+    keys.add("b")
+    keys.add("c")
+    assert len(keys.keys) == 2
+    assert keys.add("a") # evicted
+
+def test_discard_allows_retry():
+    keys = RecentKeys()
+    keys.add("a")
+    keys.discard("a")
+    assert keys.add("a")
+
+def test_view_counted_once_per_session(client, public_session):
+    event = {"session_token": public_session, "event_type": "view_assignment"}
+    assert client.post("/public/event", json=event).json()["status"] == "ok"
+    assert client.post("/public/event", json=event).json()["status"] == "ignored"
+
+def test_duplicate_in_db_keeps_session_update(client, public_session):
+    beat = {"session_token": public_session, "events": [{"event_type": "media_play", "idempotency_key": "k1"}]}
+    assert client.post("/public/heartbeat", json=beat).json()["status"] == "ok"
+    # Another worker / a restart: the in-memory cache doesn't know the key, the unique index does
+    recent_events.keys.clear()
+    beat["position"] = {"media_item_id": 1, "seconds": 3.0, "playing": True}
+    assert client.post("/public/heartbeat", json=beat).json()["status"] == "ok"
+
+    with Session(engine) as session:
+        sess = session.exec(select(AssignmentSession).where(AssignmentSession.token == public_session)).one()
+        assert sess.playback_position == 3.0
+        stored = session.exec(select(StatisticEvent).where(StatisticEvent.session_token == public_session, StatisticEvent.idempotency_key == "k1")).all()
+        assert len(stored) == 1
+
+    recent_events.keys.clear()
+    event = {"session_token": public_session, "event_type": "media_play", "idempotency_key": "k1"}
+    assert client.post("/public/event", json=event).json()["status"] == "ignored"
+
+def test_revisit_after_leave_is_a_new_view(client):
+    rec = client.post("/admin/recipients", json={"name": "Test"}).json()
+    alb = client.post("/admin/albums", json={"title": "Test"}).json()
+    assignment = client.post(f"/admin/assign?recipient_id={rec['id']}&album_id={alb['id']}").json()
+    # On SQLite the second session gets the first one's rowid back
+    for _ in range(2):
+        token = client.get(f"/public/view/{assignment['token']}").json()["session_token"]
+        assert client.post("/public/event", json={"session_token": token, "event_type": "view_assignment"}).json()["status"] == "ok"
+        client.post("/public/leave", json={"session_token": token})
+    assert client.get(f"/admin/assignments/{assignment['id']}/stats").json()["total_views"] == 2
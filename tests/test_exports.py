@@ -0,0 +1,58 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+import exports
+
+def export(client, dataset, **params):
+    response = client.get(f"/admin/export/{dataset}", params=params)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    return gzip.decompress(response.content).decode("utf-8")
+
+def export_jsonl(client, dataset, **params):
+    return [json.loads(line) for line in export(client, dataset, format="jsonl", **params).splitlines()]
+
+def assign(client, name):
+    rec = client.post("/admin/recipients", json={"name": name}).json()
+    album = client.post("/admin/albums", json={"title": f"{name}'s album"}).json()
+    return client.post(f"/admin/assign?recipient_id={rec['id']}&album_id={album['id']}").json()
+
+def test_csv_round_trip_filtered_by_album(client):
+    assignment = assign(client, "Ada, \"the\" first")
+    assign(client, "Other")
+    rows = list(csv.DictReader(io.StringIO(export(client, "assignments", album_id=assignment["album_id"]))))
+    assert len(rows) == 1
+    assert rows[0]["token"] == assignment["token"]
+    assert rows[0]["recipient_name"] == "Ada, \"the\" first"
+
+def test_events_filtered_by_album_and_date(client):
+    assignment = assign(client, "Viewer")
+    token = client.get(f"/public/view/{assignment['token']}").json()["session_token"]
+    client.post("/public/event", json={"session_token": token, "event_type": "view_assignment"})
+
+    rows = export_jsonl(client, "events", album_id=assignment["album_id"])
+    assert [(row["assignment_id"], row["event_type"]) for row in rows] == [(assignment["id"], "view_assignment")]
+    tomorrow = (datetime.utcnow() + timedelta(days=1)).isoformat()
+    assert export_jsonl(client, "events", album_id=assignment["album_id"], start=tomorrow) == []
+    assert len(export_jsonl(client, "events", album_id=assignment["album_id"], end=tomorrow)) == 1
+
+def test_recipients_filtered_by_album(client):
+    assignment = assign(client, "Listed")
+    rows = export_jsonl(client, "recipients", album_id=assignment["album_id"])
+    assert [row["id"] for row in rows] == [assignment["recipient_id"]]
+
+def test_many_chunks_decompress_to_every_row(client, monkeypatch):
+    monkeypatch.setattr(exports, "CHUNK_SIZE", 64)
+    for i in range(20):
+        client.post("/admin/recipients", json={"name": f"Bulk {i}"})
+    csv_rows = list(csv.DictReader(io.StringIO(export(client, "recipients"))))
+    jsonl_rows = export_jsonl(client, "recipients")
+    assert len(csv_rows) == len(jsonl_rows) >= 20
+    assert [int(row["id"]) for row in csv_rows] == [row["id"] for row in jsonl_rows]
+
+def test_invalid_exports(client):
+    assert client.get("/admin/export/recipients", params={"start": "2024-01-01T00:00:00"}).status_code == 400
+    assert client.get("/admin/export/users").status_code == 404
+    assert client.get("/admin/export/events", params={"format": "xml"}).status_code == 422
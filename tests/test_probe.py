@@ -0,0 +1,154 @@
+import io
+import json
+import os
+import struct
+import wave
+import pytest
+from probe import MediaProbe, UnsupportedMedia
+
+# Synthetic headers: just enough of each container for the parsers
+
+def probe(data: bytes, tmp_path) -> MediaProbe:
+    path = tmp_path / "upload.bin"
+    path.write_bytes(data)
+    p = MediaProbe()
+    for i in range(0, len(data), 64 * 1024):
+        p.feed(data[i:i + 64 * 1024])
+    p.metadata = p.finish(str(path))
+    return p
+
+def wav_bytes(seconds: float, rate: int = 8000) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\x00\x00" * int(rate * seconds))
+    return buf.getvalue()
+
+MP3_FRAME_HEADER = b"\xff\xfb\x90\x00" # MPEG-1 layer III, 128 kbps, 44.1 kHz, stereo
+MP3_FRAME_SIZE = 417
+
+def mp4_box(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+def mp4_bytes(handler: bytes, width: int = 640, height: int = 360) -> bytes:
+    mvhd = mp4_box(b"mvhd", bytes(12) + struct.pack(">II", 1000, 5000) + bytes(80))
+    tkhd = mp4_box(b"tkhd", bytes(76) + struct.pack(">II", width << 16, height << 16))
+    hdlr = mp4_box(b"hdlr", bytes(8) + handler + bytes(12))
+    trak = mp4_box(b"trak", tkhd + mp4_box(b"mdia", hdlr))
+    return mp4_box(b"ftyp", b"isom" + bytes(4)) + mp4_box(b"moov", mvhd + trak) + mp4_box(b"mdat", bytes(1000))
+
+def ebml(element_id: bytes, payload: bytes) -> bytes:
+    return element_id + bytes([0x80 | len(payload)]) + payload
+
+def webm_bytes(track_type: int) -> bytes:
+    header = ebml(b"\x1aE\xdf\xa3", ebml(b"\x42\x82", b"webm"))
+    info = ebml(b"\x15\x49\xa9\x66", ebml(b"\x2a\xd7\xb1", (1000000).to_bytes(3, "big")) + ebml(b"\x44\x89", struct.pack(">f", 2500.0)))
+    video = ebml(b"\xe0", ebml(b"\xb0", b"\x01\x40") + ebml(b"\xba", b"\xf0")) if track_type == 1 else b""
+    track = ebml(b"\xae", ebml(b"\x83", bytes([track_type])) + video)
+    tracks = ebml(b"\x16\x54\xae\x6b", track)
+    # Unknown-size segment, as written by live encoders
+    return header + b"\x18\x53\x80\x67" + b"\x01\xff\xff\xff\xff\xff\xff\xff" + info + tracks + bytes(100)
+
+def test_wav(tmp_path):
+    p = probe(wav_bytes(2), tmp_path)
+    assert p.media_type == "audio"
+    assert p.metadata["mime_type"] == "audio/wav"
+    assert p.metadata["duration"] == pytest.approx(2)
+    assert p.metadata["bitrate"] == 8000 * 16
+
+def test_mp3_cbr(tmp_path):
+    id3 = b"ID3\x03\x00\x00\x00\x00\x00\x00"
+    data = id3 + (MP3_FRAME_HEADER + bytes(MP3_FRAME_SIZE - 4)) * 100
+    p = probe(data, tmp_path)
+    assert p.metadata["mime_type"] == "audio/mpeg"
+    assert p.metadata["bitrate"] == 128000
+    assert p.metadata["duration"] == pytest.approx(100 * MP3_FRAME_SIZE * 8 / 128000, abs=0.001)
+
+def test_mp3_after_large_id3_tag(tmp_path):
+    # Embedded cover art pushes the first frame past the buffered head
+    tag_size = 300 * 1024
+    synchsafe = bytes((tag_size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    data = b"ID3\x03\x00\x00" + synchsafe + bytes(tag_size) + (MP3_FRAME_HEADER + bytes(MP3_FRAME_SIZE - 4)) * 100
+    p = probe(data, tmp_path)
+    assert p.metadata["bitrate"] == 128000
+    assert p.metadata["duration"] == pytest.approx(100 * MP3_FRAME_SIZE * 8 / 128000, abs=0.001)
+
+def test_mp3_xing_frame_count(tmp_path):
+    xing = MP3_FRAME_HEADER + bytes(32) + b"Xing" + struct.pack(">II", 1, 100)
+    data = xing + bytes(MP3_FRAME_SIZE - len(xing)) + (MP3_FRAME_HEADER + bytes(MP3_FRAME_SIZE - 4)) * 99
+    p = probe(data, tmp_path)
+    assert p.metadata["duration"] == pytest.approx(100 * 1152 / 44100, abs=0.001)
+
+def test_ogg_vorbis_duration_from_last_granule(tmp_path):
+    serial = b"\x01\x00\x00\x00"
+    packet = b"\x01vorbis" + struct.pack("<IBI", 0, 2, 44100) + bytes(14)
+    first = b"OggS\x00\x02" + struct.pack("<q", 0) + serial + bytes(8) + bytes([1, len(packet)]) + packet
+    last = b"OggS\x00\x04" + struct.pack("<q", 3 * 44100) + serial + bytes(8) + b"\x00"
+    p = probe(first + bytes(1000) + last, tmp_path)
+    assert p.metadata["mime_type"] == "audio/ogg"
+    assert p.metadata["duration"] == pytest.approx(3)
+
+def test_mp4_video(tmp_path):
+    p = probe(mp4_bytes(b"vide"), tmp_path)
+    assert p.media_type == "video"
+    assert p.metadata["mime_type"] == "video/mp4"
+    assert p.metadata["duration"] == pytest.approx(5)
+    assert (p.metadata["width"], p.metadata["height"]) == (640, 360)
+
+def test_mp4_without_video_track_is_audio(tmp_path):
+    p = probe(mp4_bytes(b"soun"), tmp_path)
+    assert p.media_type == "audio"
+    assert p.metadata["mime_type"] == "audio/mp4"
+
+def test_webm_audio_only(tmp_path):
+    p = probe(webm_bytes(track_type=2), tmp_path)
+    assert p.media_type == "audio"
+    assert p.metadata["mime_type"] == "audio/webm"
+    assert p.metadata["duration"] == pytest.approx(2.5)
+
+def test_webm_video(tmp_path):
+    p = probe(webm_bytes(track_type=1), tmp_path)
+    assert p.media_type == "video"
+    assert (p.metadata["width"], p.metadata["height"]) == (320, 240)
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(UnsupportedMedia):
+        MediaProbe().feed(b"just some text")
+
+def upload(client, name: str, data: bytes, media_type: str):
+    return client.post("/admin/upload", data={"title": name, "media_type": media_type}, files={"file": (name, data)})
+
+def test_upload_rejects_type_mismatch(client):
+    response = upload(client, "clip.mp4", mp4_bytes(b"vide"), "audio")
+    assert response.status_code == 400
+    assert "video/mp4" in response.json()["detail"]
+    assert os.listdir("media") == []
+
+def test_upload_rejects_non_media(client):
+    assert upload(client, "notes.txt", b"just some text", "audio").status_code == 400
+    assert os.listdir("media") == []
+
+def test_upload_stores_probed_metadata(client):
+    response = upload(client, "tone.wav", wav_bytes(2), "audio")
+    assert response.status_code == 200
+    assert response.json()["duration"] == pytest.approx(2)
+    assert os.listdir("media") == [response.json()["filename"]]
+
+def test_upload_accepts_audio_only_webm_as_audio(client):
+    response = upload(client, "voice.webm", webm_bytes(track_type=2), "audio")
+    assert response.status_code == 200
+    assert response.json()["mime_type"] == "audio/webm"
+
+def test_empty_file_is_rejected(tmp_path):
+    with pytest.raises(UnsupportedMedia):
+        probe(b"", tmp_path)
+
+def test_batch_reports_empty_file_and_keeps_the_rest(client):
+    files = [("files", ("empty.mp3", b"")), ("files", ("tone.wav", wav_bytes(1)))]
+    lines = [json.loads(line) for line in client.post("/admin/upload/batch", files=files).text.splitlines()]
+    errors = [line for line in lines if line["status"] == "error"]
+    assert [line["filename"] for line in errors] == ["empty.mp3"]
+    assert [item["title"] for item in lines[-1]["media"]] == ["tone"]
+    assert os.listdir("media") == [lines[-1]["media"][0]["filename"]]
@@ -0,0 +1,55 @@
+import pytest
+from ratelimit import TokenBucket, RateLimiter, limiter
+
+def test_token_bucket_allows_burst_then_refills():
+    bucket = TokenBucket(burst=2, now=0)
+    assert bucket.take(rate=1, burst=2, now=0) == 0
+    assert bucket.take(rate=1, burst=2, now=0) == 0
+    assert bucket.take(rate=1, burst=2, now=0) == pytest.approx(1)
+    assert bucket.take(rate=1, burst=2, now=1) == 0
+
+def test_token_bucket_never_exceeds_burst():
+    bucket = TokenBucket(burst=2, now=0)
+    bucket.take(rate=1, burst=2, now=1000)
+    assert bucket.tokens == pytest.approx(1)
+
+def test_rate_limiter_is_bounded():
+    small = RateLimiter(max_keys=2)
+    for key in ("a", "b", "c"):
+        small.hit("event", key)
+    assert len(small.buckets) == 2
+    assert ("event", "a") not in small.buckets
+
+@pytest.mark.parametrize("path", ["/public/heartbeat", "/public/event"])
+def test_non_string_session_token_is_a_validation_error(client, path):
+    limiter.buckets.clear()
+    assert client.post(path, json={"session_token": 123, "event_type": "media_play"}).status_code == 422
+
+def test_token_bucket_charges_cost():
+    bucket = TokenBucket(burst=5, now=0)
+    assert bucket.take(rate=1, burst=5, now=0, cost=5) == 0
+    assert bucket.take(rate=1, burst=5, now=0, cost=2) == pytest.approx(2)
+
+def test_heartbeat_events_are_capped(client, public_session):
+    limiter.buckets.clear()
+    events = [{"event_type": "media_play", "idempotency_key": str(i)} for i in range(31)]
+    beat = {"session_token": public_session, "events": events}
+    assert client.post("/public/heartbeat", json=beat).status_code == 422
+    assert client.post("/public/leave", json=beat).status_code == 422
+
+def test_heartbeat_events_share_the_event_budget(client, public_session):
+    limiter.buckets.clear()
+    events = [{"event_type": "media_play", "idempotency_key": str(i)} for i in range(30)]
+    assert client.post("/public/heartbeat", json={"session_token": public_session, "events": events}).status_code == 200
+    event = {"session_token": public_session, "event_type": "media_pause"}
+    assert client.post("/public/event", json=event).status_code == 429
+    # Leaving over budget drops the batch but still releases the session
+    beat = {"session_token": public_session, "events": [{"event_type": "media_pause"}]}
+    assert client.post("/public/leave", json=beat).status_code == 200
+    assert client.post("/public/heartbeat", json={"session_token": public_session}).status_code == 404
+
+def test_many_viewers_behind_one_ip_keep_beating(client):
+    limiter.buckets.clear()
+    responses = [client.post("/public/heartbeat", json={"session_token": f"viewer-{i}"}) for i in range(100)]
+    # Unknown sessions, but none of them throttled by the shared IP
+    assert {response.status_code for response in responses} == {404}
@@ -0,0 +1,32 @@
+import uuid
+
+def test_search_matches_word_prefixes(client, make_media):
+    # Unique words: the test database is shared across tests
+    word = "zq" + uuid.uuid4().hex[:8]
+    rec = client.post("/admin/recipients", json={"name": f"Maria {word}son", "email": "maria@example.com"}).json()
+    media_id, = make_media(f"Concerto {word}")
+
+    results = client.get("/admin/search", params={"q": word}).json()
+    assert [r["id"] for r in results["recipients"]] == [rec["id"]]
+    assert [m["id"] for m in results["media"]] == [media_id]
+
+    # Prefix of a word, case-insensitive
+    results = client.get("/admin/search", params={"q": word[:5].upper(), "kind": "media"}).json()
+    assert media_id in [m["id"] for m in results["media"]]
+    assert "recipients" not in results
+
+def test_search_sees_updates_and_deletes(client):
+    word = "zq" + uuid.uuid4().hex[:8]
+    rec = client.post("/admin/recipients", json={"name": word}).json()
+    assert client.get("/admin/search", params={"q": word, "kind": "recipients"}).json()["recipients"]
+    client.delete(f"/admin/recipients/{rec['id']}")
+    assert client.get("/admin/search", params={"q": word, "kind": "recipients"}).json()["recipients"] == []
+
+def test_search_ignores_fts_syntax(client):
+    for q in ['"', "a OR", "NEAR(", "*", "-x", "a:b", "^", "((", "'"]:
+        response = client.get("/admin/search", params={"q": q})
+        assert response.status_code == 200, q
+
+def test_search_validates_params(client):
+    assert client.get("/admin/search", params={"q": ""}).status_code == 422
+    assert client.get("/admin/search", params={"q": "x", "kind": "albums"}).status_code == 422
@@ -0,0 +1,34 @@
+import json
+import os
+import io
+import wave
+import routers.admin
+
+def wav_bytes(seconds: float) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b"\x00\x00" * int(8000 * seconds))
+    return buf.getvalue()
+
+def upload_batch(client, names, **data):
+    files = [("files", (name, wav_bytes(0.5))) for name in names]
+    response = client.post("/admin/upload/batch", files=files, data=data)
+    return [json.loads(line) for line in response.text.splitlines()]
+
+def test_batch_keeps_file_order(client):
+    album = client.post("/admin/albums", json={"title": "Batch"}).json()
+    names = [f"track{i}.wav" for i in range(5)]
+    lines = upload_batch(client, names, album_id=str(album["id"]))
+    assert [item["title"] for item in lines[-1]["media"]] == [f"track{i}" for i in range(5)]
+    assert sorted(os.listdir("media")) == sorted(item["filename"] for item in lines[-1]["media"])
+
+def test_failed_insert_hides_details_and_removes_files(client, monkeypatch):
+    def fail(*args):
+        raise RuntimeError("INSERT INTO mediaitem ... secret parameters")
+    monkeypatch.setattr(routers.admin, "bump_versions", fail)
+    lines = upload_batch(client, ["a.wav", "b.wav"])
+    assert lines[-1] == {"status": "error", "detail": "Saving media failed"}
+    assert os.listdir("media") == []
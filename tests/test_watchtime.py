@@ -0,0 +1,66 @@
+import asyncio
+from datetime import datetime, timedelta
+from sqlmodel import Session, select
+from database import engine
+from models import Recipient, Album, Assignment, AssignmentSession, MediaItem, WatchTime
+from routers.public import HeartbeatRequest, PlaybackPosition, apply_heartbeat
+import watchtime
+
+def make_assignment_and_media(session):
+    rec, alb = Recipient(name="Test"), Album(title="Test")
+    media = MediaItem(title="Track", media_type="audio", filename="track.mp3")
+    session.add_all([rec, alb, media])
+    session.commit()
+    assignment = Assignment(recipient_id=rec.id, album_id=alb.id)
+    session.add(assignment)
+    session.commit()
+    return assignment.id, media.id
+
+def beat(sess, media_item_id, seconds, playing=True):
+    req = HeartbeatRequest(session_token=sess.token, position=PlaybackPosition(media_item_id=media_item_id, seconds=seconds, playing=playing))
+    apply_heartbeat(sess, req)
+
+def test_watch_time_delta(client, monkeypatch):
+    credited = []
+    monkeypatch.setattr(watchtime, "add", lambda a, m, seconds: credited.append((m, seconds)))
+    sess = AssignmentSession(assignment_id=1, token="t", last_active_at=datetime.utcnow() - timedelta(seconds=10), playback_media_id=7, playback_position=100)
+
+    beat(sess, 7, 108)
+    assert credited == [(7, 8)]
+
+    # A forward seek is capped by the wall clock (plus slack)
+    sess.last_active_at = datetime.utcnow() - timedelta(seconds=10)
+    beat(sess, 7, 500)
+    assert credited[-1][1] < 10 + 2 + 1
+
+    # Switching tracks, or resuming after a pause, starts counting afresh
+    credited.clear()
+    beat(sess, 8, 510)
+    assert credited == []
+    beat(sess, 8, 511, playing=False)
+    beat(sess, 8, 530)
+    assert [m for m, _ in credited] == [8]
+
+def test_flush_keeps_rows_whose_parents_exist(client):
+    with Session(engine) as session:
+        assignment_id, media_id = make_assignment_and_media(session)
+    watchtime.add(assignment_id, media_id, 12.5)
+    watchtime.add(assignment_id + 1000, media_id, 3)
+    watchtime.add(assignment_id, media_id + 1000, 4)
+    watchtime.flush()
+    with Session(engine) as session:
+        rows = session.exec(select(WatchTime).where(WatchTime.assignment_id == assignment_id)).all()
+        assert [(row.media_item_id, row.seconds) for row in rows] == [(media_id, 12.5)]
+        assert session.exec(select(WatchTime).where(WatchTime.assignment_id == assignment_id + 1000)).first() is None
+
+def test_flushes_on_a_timer_without_heartbeats(monkeypatch):
+    calls = []
+    monkeypatch.setattr(watchtime, "FLUSH_INTERVAL", 0.01)
+    monkeypatch.setattr(watchtime, "flush", lambda: calls.append(1))
+
+    async def run():
+        task = asyncio.create_task(watchtime.flush_periodically())
+        await asyncio.sleep(0.1)
+        task.cancel()
+    asyncio.run(run())
+    assert len(calls) >= 2